@@ -0,0 +1,27 @@
+"""
+Atomic file writes for the Medical RAG system.
+
+Indexes, manifests and checkpoints are rewritten by the agent and by ingestion at the same
+time. Every writer gets its own temporary file next to the target and renames it into
+place, so readers only ever see a complete file and the last complete write wins.
+"""
+
+from contextlib import contextmanager
+from typing import IO, Iterator
+import os
+import tempfile
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w") -> Iterator[IO]:
+    """Open a unique temporary file for writing and move it over path once the block succeeds."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
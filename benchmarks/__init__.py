@@ -0,0 +1 @@
+"""Offline benchmarks for the Medical RAG system, run with deterministic stand-ins for OpenAI and Cohere."""
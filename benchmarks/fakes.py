@@ -0,0 +1,219 @@
+"""
+Deterministic local stand-ins for the chat model, OpenAI embeddings, the Cohere client and
+the tiktoken encoding, so the benchmarks never touch the network.
+
+install() must run before the first chat model, embedding model or reranker is created.
+Project modules create them on first use (config.get_chat_model, get_embeddings and
+CohereReranker), so importing project modules earlier is fine.
+Each fake can sleep for a configurable time per call to mimic network latency; the
+total injected sleep is tracked so benchmarks can subtract it from wall time.
+"""
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from typing import Any, Dict, List
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import types
+
+EMBEDDING_DIMENSIONS = 256
+
+FAKE_LATENCY = {
+    "llm": 0.0,        # Seconds per chat model call
+    "embedding": 0.0,  # Seconds per embedding request (one batch)
+    "rerank": 0.0,     # Seconds per rerank request
+}
+
+CALL_COUNTS: Dict[str, int] = {"llm": 0, "embedding": 0, "rerank": 0}
+
+_injected_seconds = 0.0
+_lock = threading.Lock()
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_ENCODING_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def _sleep(kind: str):
+    global _injected_seconds
+    latency = FAKE_LATENCY[kind]
+    with _lock:
+        CALL_COUNTS[kind] += 1
+        _injected_seconds += latency
+    if latency:
+        time.sleep(latency)
+
+
+def injected_seconds() -> float:
+    """Total latency injected by the fakes so far."""
+    with _lock:
+        return _injected_seconds
+
+
+def _usage(messages, text: str) -> dict:
+    prompt_tokens = sum(len(str(message.content).split()) for message in messages)
+    completion_tokens = len(text.split())
+    return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that follows the workflow's prompts with canned, deterministic replies.
+
+    With tools bound it always calls the first tool with the latest human question. The
+    grader gets "yes", the judges get fixed scores, and every other prompt gets a short
+    answer built from the end of the prompt.
+    """
+
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return FakeChatModel(tool_names=[getattr(tool, "name", str(tool)) for tool in tools])
+
+    def _reply(self, messages) -> AIMessage:
+        _sleep("llm")
+        last = messages[-1]
+        if self.tool_names and not isinstance(last, ToolMessage):
+            question = [message for message in messages if isinstance(message, HumanMessage)][-1].content
+            digest = hashlib.sha256(question.encode()).hexdigest()[:16]
+            return AIMessage(content="", tool_calls=[
+                {"name": self.tool_names[0], "args": {"query": question}, "id": f"call_{digest}"}
+            ])
+
+        prompt = last.content if isinstance(last.content, str) else str(last.content)
+        if "Decision (yes/no)" in prompt:
+            return AIMessage(content="yes")
+        if "Context Score" in prompt or "Answer Score" in prompt:
+            return AIMessage(content="Context Score: 8\nFinal Score: 9")
+        return AIMessage(content=" ".join(prompt.split()[-60:]))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message = self._reply(messages)
+        message.usage_metadata = _usage(messages, message.content)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        message = self._reply(messages)
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}
+                    for call in message.tool_calls
+                ],
+                usage_metadata=_usage(messages, ""),
+            ))
+            return
+
+        for word in message.content.split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=_usage(messages, message.content)))
+
+
+def fake_init_chat_model(*args: Any, **kwargs: Any) -> FakeChatModel:
+    return FakeChatModel()
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors, so texts sharing words are close in cosine distance."""
+
+    def __init__(self, model: str = "fake-embedding", **kwargs: Any):
+        self.model = model
+
+    @staticmethod
+    def _vector(text: str) -> List[float]:
+        vector = [0.0] * EMBEDDING_DIMENSIONS
+        for token in _TOKEN_PATTERN.findall(text.lower()):
+            bucket = int.from_bytes(hashlib.md5(token.encode()).digest()[:4], "little")
+            vector[bucket % EMBEDDING_DIMENSIONS] += 1.0
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        _sleep("embedding")
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        _sleep("embedding")
+        return self._vector(text)
+
+
+def _rerank_response(query: str, documents: List[str], top_n: int):
+    """Score documents by the share of query words they contain, like a very small reranker."""
+    query_tokens = set(_TOKEN_PATTERN.findall(query.lower()))
+    scored = []
+    for index, document in enumerate(documents):
+        overlap = len(query_tokens & set(_TOKEN_PATTERN.findall(document.lower())))
+        scored.append((overlap / (len(query_tokens) or 1), -index))
+    scored.sort(reverse=True)
+    results = [types.SimpleNamespace(index=-neg_index, relevance_score=score, document=None)
+               for score, neg_index in scored[:top_n]]
+    return types.SimpleNamespace(results=results)
+
+
+class FakeCohereClient:
+    """Stand-in for cohere.Client, so CohereReranker runs its real breaker and mapping code."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        pass
+
+    def rerank(self, *, query: str, documents: List[str], top_n: int = 5, **kwargs: Any):
+        _sleep("rerank")
+        return _rerank_response(query, documents, top_n)
+
+
+class FakeAsyncCohereClient:
+    """Stand-in for cohere.AsyncClient."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        pass
+
+    async def rerank(self, *, query: str, documents: List[str], top_n: int = 5, **kwargs: Any):
+        _sleep("rerank")
+        return _rerank_response(query, documents, top_n)
+
+
+class FakeEncoding:
+    """Stand-in for a tiktoken encoding: words and punctuation marks count as one token each."""
+
+    name = "fake"
+
+    def encode(self, text: str, **kwargs: Any) -> List[str]:
+        return _ENCODING_PATTERN.findall(text)
+
+
+def fake_encoding_for_model(model_name: str) -> FakeEncoding:
+    return FakeEncoding()
+
+
+def install(llm_latency: float = 0.0, embedding_latency: float = 0.0, rerank_latency: float = 0.0):
+    """Patch the OpenAI, Cohere and tiktoken entry points with the fakes and set their injected latency."""
+    FAKE_LATENCY.update(llm=llm_latency, embedding=embedding_latency, rerank=rerank_latency)
+
+    # get_chat_model refuses to create a model without a key; the fakes never send it anywhere
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("COHERE_API_KEY", "benchmark")
+
+    import cohere
+    import langchain.chat_models
+    import langchain_openai
+    import tiktoken
+
+    langchain.chat_models.init_chat_model = fake_init_chat_model
+    langchain_openai.OpenAIEmbeddings = FakeEmbeddings
+    cohere.Client = FakeCohereClient
+    cohere.AsyncClient = FakeAsyncCohereClient
+    # tiktoken downloads its encodings on first use
+    tiktoken.encoding_for_model = fake_encoding_for_model
+    tiktoken.get_encoding = fake_encoding_for_model
@@ -0,0 +1,236 @@
+"""
+Offline benchmarks for the Medical RAG system's own overhead.
+
+OpenAI and Cohere are replaced by the deterministic fakes in benchmarks/fakes.py, so what
+is measured is the time spent in this code base: checksumming, chunking, index builds,
+reranker bookkeeping, graph compilation and the LangGraph streaming loop.
+
+Everything runs in a temporary directory, so local chroma_db/, cache/ and results are
+never touched. One JSON record per run is appended to the output file.
+
+Usage:
+    python -m benchmarks.run_benchmarks --sizes 10,100,1000,10000 --llm-latency 0.05
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import fakes
+from benchmarks.synthetic_data import generate_patient
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARK_QUESTIONS = [
+    "What is the patient's most recent TSH?",
+    "What medications is the patient currently taking?",
+    "Does the patient have diabetes based on the A1C?",
+    "What did the imaging report show?",
+    "Which genetic variants does the patient carry?",
+    "Is the LDL cholesterol above the reference range?",
+]
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+@contextmanager
+def quiet():
+    """Silence the project's progress prints while timing."""
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def timed(fn: Callable[[], Any], repeat: int = 1) -> Dict[str, float]:
+    """Run fn repeat times and return min/median/mean wall time in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with quiet():
+            fn()
+        durations.append(time.perf_counter() - start)
+    return {"min_s": min(durations), "median_s": statistics.median(durations),
+            "mean_s": statistics.mean(durations), "repeat": repeat}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def bench_patient_size(num_files: int, repeat: int) -> Dict[str, Any]:
+    """Checksum, chunking and index build timings for a synthetic patient of a given size."""
+    import retriever
+
+    patient_id = f"synthetic_{num_files}"
+    generate_patient(patient_id, num_files, seed=num_files)
+    files = glob.glob(f"data/{patient_id}/**/*.md", recursive=True)
+
+    def checksum_cold():
+        shutil.rmtree(os.path.join(retriever.PERSIST_DIRECTORY, "manifests"), ignore_errors=True)
+        retriever.generate_patient_data_checksum(patient_id)
+
+    results: Dict[str, Any] = {
+        "files": len(files),
+        "bytes": sum(os.path.getsize(path) for path in files),
+        "checksum_cold": timed(checksum_cold, repeat),
+        "checksum_warm": timed(lambda: retriever.generate_patient_data_checksum(patient_id), repeat),
+    }
+
+    chunks: List[Any] = []
+    results["load_documents"] = timed(lambda: chunks.extend(retriever.load_documents(patient_id)) or None)
+    results["chunks"] = len(chunks)
+
+    results["index_build"] = timed(lambda: retriever.create_retriever(patient_id))
+    results["index_open_warm"] = timed(lambda: retriever.create_retriever(patient_id), repeat)
+    return results
+
+
+def bench_reranked_retriever(candidate_counts: List[int], repeat: int) -> Dict[str, Any]:
+    """RerankedRetriever dedup and index-to-document mapping, without network time."""
+    from langchain_core.documents import Document
+    from langchain_core.retrievers import BaseRetriever
+    from reranked_retriever import RerankedRetriever
+
+    class StaticRetriever(BaseRetriever):
+        docs: List[Document]
+
+        def _get_relevant_documents(self, query, *, run_manager):
+            return [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in self.docs]
+
+    results = {}
+    for count in candidate_counts:
+        # Every fifth candidate duplicates another, as overlapping chunks do in practice
+        docs = [Document(page_content=f"Lab result {index % max(count * 4 // 5, 1)}: TSH value {index} " * 20,
+                         metadata={"source": f"data/synthetic/labs/{index}.md"})
+                for index in range(count)]
+        reranked = RerankedRetriever(StaticRetriever(docs=docs), top_k=5, verbose=False, cache=None)
+        ranking = [(index, 1.0 / (index + 1)) for index in range(min(5, count))]
+
+        results[str(count)] = {
+            "deduplicate": timed(lambda: reranked._deduplicate_documents(docs), repeat),
+            "apply_ranking": timed(lambda: reranked._apply_ranking(docs, ranking), repeat),
+            "invoke": timed(lambda: reranked.invoke("What is the patient's TSH?"), repeat),
+        }
+    return results
+
+
+def bench_workflow(num_questions: int, repeat: int) -> Dict[str, Any]:
+    """Graph compile time and per-question streaming overhead on the real drapoel data."""
+    with quiet():
+        from medical_agent import create_workflow, run_single_question
+
+    shutil.copytree(os.path.join(REPO_ROOT, "data", "drapoel"), os.path.join("data", "drapoel"), dirs_exist_ok=True)
+    results: Dict[str, Any] = {"create_workflow": timed(lambda: create_workflow(judge_mode="off"), repeat)}
+
+    with quiet():
+        graph = create_workflow(judge_mode="off")
+        # The patient's retriever is opened on first use; keep that out of the stream timings
+        run_single_question({"id": "bench_warmup", "text": BENCHMARK_QUESTIONS[0]}, graph=graph, verbose=False)
+
+    overheads, totals = [], []
+    for index in range(num_questions):
+        question = {"id": f"bench_{index}", "text": f"{BENCHMARK_QUESTIONS[index % len(BENCHMARK_QUESTIONS)]} ({index})"}
+        injected_before = fakes.injected_seconds()
+        start = time.perf_counter()
+        with quiet():
+            run_single_question(question, graph=graph, verbose=False)
+        elapsed = time.perf_counter() - start
+        totals.append(elapsed)
+        overheads.append(elapsed - (fakes.injected_seconds() - injected_before))
+
+    results["stream"] = {
+        "questions": num_questions,
+        "median_total_s": statistics.median(totals),
+        "median_overhead_s": statistics.median(overheads),
+        "max_overhead_s": max(overheads),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Medical RAG benchmarks")
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated synthetic patient sizes in files")
+    parser.add_argument("--candidates", default="15,50,200", help="Comma-separated reranker candidate counts")
+    parser.add_argument("--questions", type=int, default=20, help="Questions streamed end to end")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions for the cheaper timings")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Injected seconds per chat model call")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Injected seconds per embedding request")
+    parser.add_argument("--rerank-latency", type=float, default=0.0, help="Injected seconds per rerank request")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default=None, help="Vector store backend override")
+    parser.add_argument("--output", default=os.path.join(REPO_ROOT, "benchmarks", "results.jsonl"),
+                        help="JSONL file the run record is appended to")
+    args = parser.parse_args()
+
+    # The fakes must be in place before any project module creates its clients
+    fakes.install(args.llm_latency, args.embedding_latency, args.rerank_latency)
+    sys.path.insert(0, REPO_ROOT)
+
+    workdir = tempfile.mkdtemp(prefix="medrag-bench-")
+    os.chdir(workdir)
+    try:
+        with quiet():
+            import retriever
+        if args.backend:
+            retriever.RETRIEVER_CONFIG["backend"] = args.backend
+
+        record: Dict[str, Any] = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "backend": retriever.RETRIEVER_CONFIG["backend"],
+                "hybrid": retriever.RETRIEVER_CONFIG["hybrid"],
+                "llm_latency_s": args.llm_latency,
+                "embedding_latency_s": args.embedding_latency,
+                "rerank_latency_s": args.rerank_latency,
+            },
+            "patient_sizes": {},
+        }
+
+        for size in (int(value) for value in args.sizes.split(",")):
+            log(f"⏱️  Patient with {size} files...")
+            record["patient_sizes"][str(size)] = bench_patient_size(size, args.repeat)
+
+        log("⏱️  RerankedRetriever...")
+        record["reranked_retriever"] = bench_reranked_retriever(
+            [int(value) for value in args.candidates.split(",")], args.repeat * 20)
+
+        log("⏱️  Workflow compile and stream...")
+        record["workflow"] = bench_workflow(args.questions, args.repeat)
+        record["fake_calls"] = dict(fakes.CALL_COUNTS)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+    print(json.dumps(record, indent=2))
+    log(f"📄 Appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Startup benchmark for the Medical RAG system.
+
+Short-lived worker processes and CLI tools pay for imports and first-use setup on every
+run. Each measurement here runs in a fresh interpreter:
+- `python -X importtime -c "import medical_agent"`: total import time, the slowest
+  imports, and which heavy SDKs were loaded by the import alone
+- cold start to first answer: interpreter start, imports, create_workflow and one question
+  streamed end to end, with OpenAI and Cohere replaced by the fakes in benchmarks/fakes.py
+
+The patient index is built once beforehand, so cold starts find it on disk as a worker
+would. Installing the fakes imports the OpenAI and Cohere SDKs, which a real run imports on
+first use instead, and loading them pulls in langchain_core before medical_agent is
+imported. The phases are therefore a breakdown of total_s, the number to compare, while
+the bare import cost is the importtime measurement.
+
+Everything runs in a temporary directory. One JSON record per run is appended to the output file.
+
+Usage:
+    python -m benchmarks.startup --repeat 5 --top 15
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import fakes
+from benchmarks.run_benchmarks import BENCHMARK_QUESTIONS, REPO_ROOT, git_commit, log, quiet
+
+# SDKs that importing medical_agent should not load; they are imported on first use
+DEFERRED_MODULES = ["chromadb", "langchain_chroma", "langchain_community", "langchain_openai", "openai", "cohere"]
+
+
+def _environment() -> Dict[str, str]:
+    """Environment for child processes: project importable, and no OpenAI key needed to import."""
+    env = dict(os.environ)
+    env.pop("OPENAI_API_KEY", None)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Rows of `python -X importtime` output as module, self and cumulative seconds."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = (field.strip() for field in line.split(":", 1)[1].split("|"))
+        rows.append({"module": module, "self_s": int(self_us) / 1e6, "cumulative_s": int(cumulative_us) / 1e6})
+    return rows
+
+
+def bench_import(repeat: int, top: int) -> Dict[str, Any]:
+    """Import time of medical_agent in fresh interpreters, with the slowest imports of the median run."""
+    code = ("import json, sys, medical_agent; "
+            f"print(json.dumps(sorted(m for m in {DEFERRED_MODULES!r} if m in sys.modules)))")
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_ROOT,
+                                 env=_environment(), capture_output=True, text=True, check=True)
+        wall = time.perf_counter() - start
+        rows = parse_importtime(process.stderr)
+        total = next(row["cumulative_s"] for row in reversed(rows) if row["module"] == "medical_agent")
+        runs.append({"wall_s": wall, "import_s": total, "rows": rows,
+                     "deferred_loaded": json.loads(process.stdout.strip().splitlines()[-1])})
+
+    runs.sort(key=lambda run: run["import_s"])
+    median_run = runs[len(runs) // 2]
+    dependencies = [row for row in median_run["rows"] if row["module"] != "medical_agent"]
+    return {
+        "median_import_s": median_run["import_s"],
+        "median_process_wall_s": statistics.median(run["wall_s"] for run in runs),
+        "modules_imported": len(median_run["rows"]),
+        "deferred_modules_loaded": median_run["deferred_loaded"],
+        "slowest_cumulative": [
+            {"module": row["module"], "cumulative_s": row["cumulative_s"]}
+            for row in sorted(dependencies, key=lambda row: row["cumulative_s"], reverse=True)[:top]
+        ],
+        "slowest_self": [
+            {"module": row["module"], "self_s": row["self_s"]}
+            for row in sorted(dependencies, key=lambda row: row["self_s"], reverse=True)[:top]
+        ],
+        "repeat": repeat,
+    }
+
+
+def cold_start_child():
+    """Run in a fresh process: install the fakes, import, compile and answer one question."""
+    start = time.perf_counter()
+    fakes.install()
+    installed = time.perf_counter()
+    with quiet():
+        import medical_agent
+        imported = time.perf_counter()
+        graph = medical_agent.create_workflow(judge_mode="off")
+        compiled = time.perf_counter()
+        medical_agent.run_single_question({"id": "startup", "text": BENCHMARK_QUESTIONS[0]}, graph=graph, verbose=False)
+    answered = time.perf_counter()
+    print(json.dumps({
+        "fakes_install_s": installed - start,
+        "import_s": imported - installed,
+        "create_workflow_s": compiled - imported,
+        "first_answer_s": answered - compiled,
+    }))
+
+
+def _run_child(workdir: str) -> Dict[str, float]:
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child"], cwd=workdir,
+                             env=_environment(), capture_output=True, text=True)
+    if process.returncode:
+        raise RuntimeError(f"Cold start run failed:\n{process.stderr}")
+    phases = json.loads(process.stdout.strip().splitlines()[-1])
+    phases["total_s"] = time.perf_counter() - start
+    return phases
+
+
+def bench_cold_start(repeat: int) -> Dict[str, Any]:
+    """Fresh-process time from interpreter start to the first streamed answer on the drapoel data."""
+    workdir = tempfile.mkdtemp(prefix="medrag-startup-")
+    try:
+        shutil.copytree(os.path.join(REPO_ROOT, "data", "drapoel"), os.path.join(workdir, "data", "drapoel"))
+        # Build the index and warm the embedding cache, as a worker would find them
+        index_build = _run_child(workdir)
+        runs = [_run_child(workdir) for _ in range(repeat)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results: Dict[str, Any] = {phase: statistics.median(run[phase] for run in runs) for phase in runs[0]}
+    results["interpreter_and_harness_s"] = results["total_s"] - sum(
+        results[phase] for phase in ("fakes_install_s", "import_s", "create_workflow_s", "first_answer_s"))
+    results["index_build_run_s"] = index_build["total_s"]
+    results["repeat"] = repeat
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and cold-start benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to report")
+    parser.add_argument("--output", default=os.path.join(REPO_ROOT, "benchmarks", "startup_results.jsonl"),
+                        help="JSONL file the run record is appended to")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        cold_start_child()
+        return
+
+    record: Dict[str, Any] = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+    log("⏱️  Import time...")
+    record["import"] = bench_import(args.repeat, args.top)
+
+    log("⏱️  Cold start to first answer...")
+    record["cold_start"] = bench_cold_start(args.repeat)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+    print(json.dumps(record, indent=2))
+    log(f"📄 Appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
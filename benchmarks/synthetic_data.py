@@ -0,0 +1,134 @@
+"""
+Synthetic patient generator shaped like data/drapoel.
+
+A patient gets an intake form, a medication list and, for the remaining files, a mix of
+lab panels, chat logs, imaging reports and genetics reports in the same markdown style
+as the real data. Output is deterministic for a given seed.
+"""
+
+from typing import List
+import os
+import random
+
+LAB_TESTS = [
+    ("TSH (µIU/mL)", 0.4, 4.5), ("Free T4 (ng/dL)", 0.8, 1.8), ("Hemoglobin A1C (%)", 4.0, 5.6),
+    ("Glucose (mg/dL)", 70, 99), ("LDL Cholesterol (mg/dL)", 0, 100), ("HDL Cholesterol (mg/dL)", 40, 90),
+    ("Triglycerides (mg/dL)", 0, 150), ("Total Cholesterol (mg/dL)", 125, 200), ("hs-CRP (mg/L)", 0, 1.0),
+    ("Vitamin D, 25-OH (ng/mL)", 30, 100), ("Hemoglobin (g/dL)", 13.2, 17.1), ("WBC (x10³/µL)", 3.8, 10.8),
+    ("Platelets (x10³/µL)", 140, 400), ("Creatinine (mg/dL)", 0.6, 1.3), ("ALT (U/L)", 9, 46),
+    ("AST (U/L)", 10, 40), ("Sodium (mmol/L)", 135, 146), ("Potassium (mmol/L)", 3.5, 5.3),
+]
+
+PANELS = ["thyroid", "a1c", "lipid", "cmp", "cbc", "hs-crp", "vit-d", "urinalysis"]
+
+MEDICATIONS = [
+    ("Levothyroxine", "75 mcg", "Once daily (AM, fasting)", "Primary Hypothyroidism"),
+    ("Atorvastatin", "20 mg", "Once daily (PM)", "Hypercholesterolemia"),
+    ("Aspirin (low-dose)", "81 mg", "Once daily", "Cardiovascular risk reduction"),
+    ("Metformin", "500 mg", "Twice daily", "Prediabetes"),
+    ("Lisinopril", "10 mg", "Once daily", "Hypertension"),
+    ("Omeprazole", "20 mg", "Once daily (AM)", "GERD"),
+]
+
+CHAT_LINES = [
+    "I have been feeling more fatigued lately.",
+    "My doctor adjusted my levothyroxine dose recently.",
+    "Should I take my statin in the morning or at night?",
+    "My last TSH was slightly elevated.",
+    "I started walking thirty minutes every day.",
+    "Is it normal to have muscle aches on atorvastatin?",
+    "My vitamin D was low at the last check.",
+]
+
+IMAGING_FINDINGS = [
+    "No acute intracranial abnormality.", "Mild degenerative changes of the lumbar spine.",
+    "Coronary artery calcium score of 112.", "Small simple renal cyst, no follow-up needed.",
+    "Mild hepatic steatosis.", "Bone density consistent with mild osteopenia.",
+]
+
+VARIANTS = [
+    ("APOE", "rs429358", "C/T", "ε3/ε4, increased Alzheimer's risk"),
+    ("MTHFR", "rs1801133", "C/T", "Reduced folate metabolism"),
+    ("SLCO1B1", "rs4149056", "T/C", "Increased statin myopathy risk"),
+    ("CYP2C19", "rs4244285", "G/A", "Intermediate clopidogrel metabolizer"),
+    ("FTO", "rs9939609", "A/T", "Modestly increased obesity risk"),
+]
+
+
+def _date(rng: random.Random) -> str:
+    return f"20{rng.randint(20, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def _table(header: List[str], rows: List[List[str]]) -> str:
+    lines = ["| " + " | ".join(header) + " |", "|" + "|".join("---" for _ in header) + "|"]
+    lines.extend("| " + " | ".join(row) + " |" for row in rows)
+    return "\n".join(lines)
+
+
+def _lab_report(rng: random.Random, panel: str) -> str:
+    rows = []
+    for name, low, high in rng.sample(LAB_TESTS, rng.randint(3, 8)):
+        value = round(rng.uniform(low * 0.7, high * 1.3 if high else 1.0), 1)
+        flag = "**H**" if value > high else "**L**" if value < low else ""
+        rows.append([name, str(value), f"{low} – {high}", flag])
+    return f"## {panel.upper()} Panel\n\nCollected: {_date(rng)}\n\n" + \
+        _table(["Test", "Result", "Reference Range", "Flag"], rows) + "\n"
+
+
+def _chat_log(rng: random.Random) -> str:
+    day = _date(rng)
+    lines = [f"## User Chat Log with AI Medical Agent ({day})", ""]
+    for _ in range(rng.randint(4, 16)):
+        lines.append(f"**Patient** ({day}): {rng.choice(CHAT_LINES)}")
+        lines.append(f"**HealthAIBot** ({day}): Thanks for sharing. {rng.choice(CHAT_LINES)} "
+                     "Please discuss any changes with your healthcare provider.")
+    return "\n".join(lines) + "\n"
+
+
+def _imaging_report(rng: random.Random) -> str:
+    findings = "\n".join(f"- {finding}" for finding in rng.sample(IMAGING_FINDINGS, rng.randint(2, 4)))
+    return f"## Imaging Report\n\nDate: {_date(rng)}\n\n### Findings\n\n{findings}\n\n### Impression\n\n{rng.choice(IMAGING_FINDINGS)}\n"
+
+
+def _genetics_report(rng: random.Random) -> str:
+    rows = [list(variant) for variant in rng.sample(VARIANTS, rng.randint(2, len(VARIANTS)))]
+    return "## Genetic Test Results\n\n" + _table(["Gene", "Variant", "Genotype", "Interpretation"], rows) + "\n"
+
+
+def _intake(rng: random.Random) -> str:
+    medications = "\n".join(f"- {name} {dose} {frequency}" for name, dose, frequency, _ in rng.sample(MEDICATIONS, 3))
+    return (f"## Patient Intake Form\n\nDate: {_date(rng)}\n\n### Medications (Current)\n\n{medications}\n\n"
+            f"### Family History\n\n- Father: coronary artery disease\n- Mother: hypothyroidism\n")
+
+
+def _medications(rng: random.Random) -> str:
+    rows = [list(medication) for medication in rng.sample(MEDICATIONS, rng.randint(2, len(MEDICATIONS)))]
+    return f"## Prescription Medications\n\nLast Updated: {_date(rng)}\n\n" + \
+        _table(["Medication", "Dose", "Frequency", "Indication"], rows) + "\n"
+
+
+def generate_patient(patient_id: str, num_files: int, data_directory: str = "data", seed: int = 0) -> str:
+    """Write a synthetic patient with num_files markdown files. Returns the patient directory."""
+    rng = random.Random(seed)
+    patient_directory = os.path.join(data_directory, patient_id)
+
+    files = {"intake.md": _intake(rng), "medications.md": _medications(rng)}
+    for index in range(max(num_files - len(files), 0)):
+        kind = rng.random()
+        if kind < 0.6:
+            panel = rng.choice(PANELS)
+            files[f"labs/{panel}-{index:05d}.md"] = _lab_report(rng, panel)
+        elif kind < 0.8:
+            files[f"chat/chat-{index:05d}.md"] = _chat_log(rng)
+        elif kind < 0.9:
+            files[f"imaging/imaging-{index:05d}.md"] = _imaging_report(rng)
+        else:
+            files[f"genetics/genetics-{index:05d}.md"] = _genetics_report(rng)
+
+    for relative_path, content in list(files.items())[:num_files]:
+        path = os.path.join(patient_directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    return patient_directory
@@ -0,0 +1,146 @@
+"""
+BM25 Index for Medical RAG System
+In-memory lexical index over the same chunks as the vector store, so that exact tokens
+such as "TSH", "A1C", "Levothyroxine" or rsIDs are matched literally.
+"""
+
+from langchain_core.documents import Document
+from collections import Counter, defaultdict
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import heapq
+import json
+import math
+import re
+
+from atomic_write import atomic_write
+
+TOKEN_PATTERN = re.compile(r"\w+(?:[-.]\w+)*")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "has", "have",
+    "how", "in", "is", "it", "of", "on", "or", "that", "the", "their", "this", "to", "was", "what",
+    "when", "which", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens. Compound tokens ("hs-crp", "5.9") are kept along with their parts."""
+    tokens = []
+    for match in TOKEN_PATTERN.findall(text.lower()):
+        if match in STOPWORDS:
+            continue
+        tokens.append(match)
+        if "-" in match or "." in match:
+            tokens.extend(part for part in re.split(r"[-.]", match) if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks, backed by an inverted index."""
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[dict], k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.k1 = k1
+        self.b = b
+
+        # term -> list of (chunk index, term frequency)
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths = []
+        for index, text in enumerate(texts):
+            term_counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                self.postings[term].append((index, count))
+
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        total = len(texts)
+        self.idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def score(self, query: str) -> Dict[int, float]:
+        """BM25 score of every chunk that shares at least one term with the query."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[index] / (self.avg_doc_length or 1.0))
+                scores[index] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 25, categories: Optional[Collection[str]] = None) -> List[Tuple[Document, float]]:
+        """Return the k best matching chunks with their BM25 scores, optionally only from some categories."""
+        scores = self.score(query)
+        if categories is not None:
+            scores = {index: score for index, score in scores.items()
+                      if self.metadatas[index].get("category") in categories}
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [
+            (Document(id=self.ids[index], page_content=self.texts[index], metadata=dict(self.metadatas[index])), score)
+            for index, score in best
+        ]
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "BM25Index":
+        """Build an index over every chunk stored in a vector store."""
+        stored = vectorstore.get(include=["documents", "metadatas"])
+        return cls(stored["ids"], stored["documents"], [m or {} for m in stored["metadatas"]])
+
+    def save(self, path: str, checksum: str):
+        """Persist the chunks the index was built from, tagged with the patient data checksum."""
+        with atomic_write(path) as f:
+            json.dump({"checksum": checksum, "ids": self.ids, "texts": self.texts, "metadatas": self.metadatas}, f)
+
+    @classmethod
+    def load(cls, path: str, checksum: str) -> Optional["BM25Index"]:
+        """Load a persisted index, or return None if it is missing or was built from other data."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("checksum") != checksum:
+            return None
+        return cls(data["ids"], data["texts"], data["metadatas"])
+
+
+def score_texts(query: str, texts: List[str]) -> List[float]:
+    """BM25 scores of the query against an ad-hoc list of texts, in input order."""
+    index = BM25Index([str(i) for i in range(len(texts))], texts, [{} for _ in texts])
+    scores = index.score(query)
+    return [scores.get(i, 0.0) for i in range(len(texts))]
+
+
+def _fusion_key(doc: Document) -> str:
+    return doc.id or hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Document]], k: int = 60, limit: Optional[int] = None) -> List[Document]:
+    """Fuse ranked lists with reciprocal rank fusion: score(d) = sum of 1 / (k + rank)."""
+    scores = defaultdict(float)
+    documents = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = _fusion_key(doc)
+            scores[key] += 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    if limit is not None:
+        ranked = ranked[:limit]
+
+    fused = []
+    for key in ranked:
+        doc = documents[key]
+        doc.metadata["rrf_score"] = scores[key]
+        fused.append(doc)
+    return fused
@@ -0,0 +1,71 @@
+"""
+Execution Budget for Medical RAG System
+Bounds the work spent on one question: rewrite iterations, wall-clock time and tokens.
+
+The budget travels in the graph state. Nodes check it before calling a model, and once the
+deadline or token budget is spent they take the best-effort path: no more retrieval,
+grading, rewriting or compression, straight to generate_answer with the context retrieved
+so far. The rewrite cap is enforced where a "not relevant" grade would loop back.
+Every node that calls a model, the grader included, adds its tokens to tokens_used.
+"""
+
+from langchain_core.messages import AIMessage, ToolMessage
+from typing import Any, Dict, List, Optional
+import time
+
+import tracing
+
+BUDGET_CONFIG = {
+    "max_rewrites": 2,        # Rewrite iterations before answering with the best context found
+    "max_seconds": 60.0,      # Wall-clock deadline per question
+    "max_tokens": 50_000,     # Prompt plus completion tokens per question
+}
+
+
+def new_budget() -> Dict[str, Any]:
+    """A budget for a question starting now, from BUDGET_CONFIG."""
+    return {
+        "max_rewrites": BUDGET_CONFIG["max_rewrites"],
+        "deadline": time.time() + BUDGET_CONFIG["max_seconds"],
+        "max_tokens": BUDGET_CONFIG["max_tokens"],
+    }
+
+
+def _budget(state) -> Dict[str, Any]:
+    # States without a budget, e.g. from a direct graph.invoke, still get a bounded rewrite loop
+    return state.get("budget") or {"max_rewrites": BUDGET_CONFIG["max_rewrites"], "deadline": None, "max_tokens": None}
+
+
+def budget_exhausted(state) -> Optional[str]:
+    """Return "deadline" or "tokens" if that part of the budget is spent, otherwise None."""
+    budget = _budget(state)
+    if budget.get("deadline") is not None and time.time() >= budget["deadline"]:
+        return "deadline"
+    if budget.get("max_tokens") is not None and state.get("tokens_used", 0) >= budget["max_tokens"]:
+        return "tokens"
+    return None
+
+
+def rewrites_exhausted(state) -> bool:
+    return state.get("rewrite_count", 0) >= _budget(state)["max_rewrites"]
+
+
+def usage_tokens(message) -> int:
+    """Prompt plus completion tokens reported for a model response."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens", usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+
+
+def latest_context(messages: List) -> Optional[Any]:
+    """The most recent retrieval result or compressed context, skipping rewrites and tool calls."""
+    for message in reversed(messages):
+        if isinstance(message, ToolMessage):
+            return message
+        if isinstance(message, AIMessage) and not message.tool_calls:
+            return message
+    return None
+
+
+def report_exhausted(node: str, reason: str):
+    tracing.annotate(budget_exhausted=reason)
+    print(f"⏱️  Budget exhausted ({reason}) at {node} - answering with the context retrieved so far")
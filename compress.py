@@ -1,16 +1,43 @@
 """
 Context Compressor for Medical RAG System
-Uses an LLM to remove clearly irrelevant information from retrieved context while being very conservative.
+Cuts the retrieved context down to what helps answer the question.
+
+The default extractive mode runs locally in milliseconds. Retrieved chunks are scored by
+their rerank score, query-term overlap and embedding similarity to the query, and the best
+are packed into a token budget. A chunk that does not fit whole contributes its best
+matching sentences, table rows kept together. Kept text is always verbatim, so lab values
+cannot be altered. The "llm_ids" mode asks the LLM only for the numbers of the chunks to
+keep, and the "llm" mode has the LLM rewrite the whole context.
 """
 
 from langgraph.graph import MessagesState
-from langchain.chat_models import init_chat_model
+from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, AIMessage
 from custom_state import MedicalRAGState
-from typing import Dict, Any
+from lab_store import LAB_TOOL_NAME
+from budget import budget_exhausted, report_exhausted, usage_tokens
+from bm25_index import score_texts
+from embedding_cache import get_embeddings
+from token_counter import count_tokens
+from typing import Dict, Any, List, Optional, Tuple
+import re
+
+import numpy as np
 
 # Load shared configuration (includes dotenv loading)
 import config
+import tracing
+
+COMPRESS_CONFIG = {
+    "mode": "extractive",            # "extractive" (local, verbatim), "llm_ids" (LLM picks chunks, verbatim) or "llm" (LLM rewrite)
+    "max_tokens": 1500,              # Token budget of the compressed context
+    "min_relative_score": 0.3,       # Chunks scoring below this fraction of the best chunk are dropped
+    "weights": {"rerank": 0.5, "overlap": 0.25, "embedding": 0.25},
+}
+
+COMPRESS_MODES = ("extractive", "llm_ids", "llm")
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[A-Z*(])")
 
 COMPRESS_PROMPT = """
 You are a medical context compressor. Your job is to review the retrieved medical context and ONLY remove information that you are HIGHLY CONFIDENT is completely irrelevant to answering the medical question.
@@ -40,28 +67,191 @@ Remember: It's better to keep too much information than to accidentally remove s
 Return ONLY the compressed context, maintaining all formatting:
 """
 
-# Initialize the compressor model
-compressor_model = init_chat_model("openai:gpt-4o", temperature=0)
+COMPRESS_IDS_PROMPT = """
+You are a medical context selector. Below are numbered chunks of retrieved patient data.
+Return the numbers of every chunk that could help answer the medical question.
+
+Be conservative: when in doubt, keep the chunk.
+
+Medical Question: {question}
+
+Chunks:
+{chunks}
+
+Return ONLY the chunk numbers to keep, comma separated (e.g. 1, 3, 4):"""
+
+
+def _context_documents(message) -> List[Document]:
+    """The retrieved chunks: the tool message artifact, or the content split at blank lines."""
+    artifact = getattr(message, "artifact", None)
+    if artifact and all(isinstance(doc, Document) for doc in artifact):
+        return list(artifact)
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return [Document(page_content=part) for part in content.split("\n\n") if part.strip()]
+
+
+def _retrieval_query(messages) -> Optional[str]:
+    """The query of the tool call that produced the context, if any."""
+    for message in reversed(messages):
+        for call in getattr(message, "tool_calls", None) or []:
+            if "query" in call.get("args", {}):
+                return call["args"]["query"]
+    return None
+
+
+def _relative(scores: List[float]) -> List[float]:
+    best = max(scores, default=0.0)
+    return [score / best if best > 0 else 0.0 for score in scores]
+
+
+def score_chunks(question: str, query: str, docs: List[Document]) -> List[float]:
+    """Weighted mix of rerank score, query-term overlap and embedding similarity, each relative to the best chunk."""
+    weights = COMPRESS_CONFIG["weights"]
+    texts = [doc.page_content for doc in docs]
+    signals = {"overlap": _relative(score_texts(f"{question} {query}", texts))}
+
+    rerank_scores = [doc.metadata.get("rerank_score") for doc in docs]
+    if all(score is not None for score in rerank_scores):
+        signals["rerank"] = _relative([float(score) for score in rerank_scores])
+
+    if weights.get("embedding"):
+        # Only vectors already cached by retrieval are used; on any miss the signal is dropped
+        # rather than paying for an embedding call on the query path
+        cached = get_embeddings().cached_vectors([query] + texts)
+        if all(vector is not None for vector in cached):
+            query_vector = np.asarray(cached[0], dtype=np.float32)
+            vectors = np.asarray(cached[1:], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+            similarities = vectors @ query_vector / np.where(norms == 0, 1.0, norms)
+            signals["embedding"] = _relative([max(float(value), 0.0) for value in similarities])
+        tracing.annotate(embedding_signal="embedding" in signals)
+
+    total_weight = sum(weights[name] for name in signals)
+    return [
+        sum(weights[name] * values[index] for name, values in signals.items()) / total_weight
+        for index in range(len(docs))
+    ]
+
+
+def _units(text: str) -> List[str]:
+    """Split a chunk into verbatim sentences, keeping each table whole and headings with what follows."""
+    units: List[str] = []
+    table: List[str] = []
+    heading = ""
+
+    def add(unit: str):
+        nonlocal heading
+        units.append(f"{heading}\n{unit}" if heading else unit)
+        heading = ""
+
+    for line in text.splitlines() + [""]:
+        if line.lstrip().startswith("|"):
+            table.append(line)
+            continue
+        if table:
+            add("\n".join(table))
+            table = []
+        if not line.strip():
+            continue
+        if line.lstrip().startswith("#"):
+            heading = f"{heading}\n{line}" if heading else line
+            continue
+        for sentence in SENTENCE_PATTERN.split(line.strip()):
+            add(sentence)
+    if heading:
+        units.append(heading)
+    return units
+
+
+def _best_units(question: str, text: str, budget: int) -> Tuple[str, int]:
+    """The chunk's sentences that share terms with the question and fit the budget, in their original order."""
+    units = _units(text)
+    scores = score_texts(question, units)
+    kept, used = set(), 0
+    for index in sorted(range(len(units)), key=lambda i: -scores[i]):
+        if scores[index] <= 0:
+            break
+        tokens = count_tokens(units[index])
+        if used + tokens <= budget:
+            kept.add(index)
+            used += tokens
+    return "\n".join(units[index] for index in sorted(kept)), used
+
+
+def pack_chunks(question: str, docs: List[Document], scores: List[float], max_tokens: int) -> Tuple[List[str], int]:
+    """Pack the best chunks into max_tokens, best first. Returns the kept texts and the tokens used."""
+    best = max(scores, default=0.0)
+    threshold = best * COMPRESS_CONFIG["min_relative_score"]
+    kept, used = [], 0
+    for index in sorted(range(len(docs)), key=lambda i: -scores[i]):
+        if scores[index] <= 0 or scores[index] < threshold or used >= max_tokens:
+            continue
+        text = docs[index].page_content
+        tokens = count_tokens(text)
+        if used + tokens > max_tokens:
+            text, tokens = _best_units(question, text, max_tokens - used)
+        if text:
+            kept.append(text)
+            used += tokens
+    return kept, used
+
+
+def select_chunk_ids(question: str, docs: List[Document]) -> Tuple[List[float], int]:
+    """Ask the LLM which chunks to keep. Returns 1.0 for kept chunks, 0.0 for the rest, and the tokens spent."""
+    chunks = "\n\n".join(f"[{index}]\n{doc.page_content}" for index, doc in enumerate(docs, start=1))
+    response = config.get_chat_model().invoke([{"role": "user", "content": COMPRESS_IDS_PROMPT.format(question=question, chunks=chunks)}])
+    selected = {int(number) for number in re.findall(r"\d+", response.content) if 1 <= int(number) <= len(docs)}
+    # An unparseable answer keeps everything rather than dropping context
+    return [1.0 if not selected or index in selected else 0.0 for index in range(1, len(docs) + 1)], usage_tokens(response)
+
 
 def compress_context(state: MedicalRAGState) -> Dict[str, Any]:
-    """Compress retrieved context by removing clearly irrelevant information."""
+    """Compress retrieved context to what is relevant to the question, using COMPRESS_CONFIG["mode"]."""
     question = state["messages"][0].content
     current_context = state["messages"][-1].content
+    mode = COMPRESS_CONFIG["mode"]
     
-    print(f"\n🗜️  Compressing context...")
-    print(f"📏 Original context length: {len(current_context)} characters")
+    # Lab lookups already return only the matching results
+    if getattr(state["messages"][-1], "name", None) == LAB_TOOL_NAME:
+        print(f"\n🧪 Lab results need no compression ({len(current_context)} characters)")
+        return {}
     
-    prompt = COMPRESS_PROMPT.format(
-        question=question,
-        context=current_context
-    )
+    # Extractive compression makes no model calls, so it runs even over budget
+    reason = budget_exhausted(state) if mode != "extractive" else None
+    if reason:
+        report_exhausted("compress_context", reason)
+        return {}
+    
+    print(f"\n🗜️  Compressing context ({mode})...")
+    print(f"📏 Original context length: {len(current_context)} characters")
     
-    response = compressor_model.invoke([{"role": "user", "content": prompt}])
-    compressed_context = response.content
+    tokens_used = 0
+    if mode == "llm":
+        prompt = COMPRESS_PROMPT.format(
+            question=question,
+            context=current_context
+        )
+        response = config.get_chat_model().invoke([{"role": "user", "content": prompt}])
+        compressed_context = response.content
+        tokens_used = usage_tokens(response)
+    else:
+        docs = _context_documents(state["messages"][-1])
+        if mode == "llm_ids":
+            scores, tokens_used = select_chunk_ids(question, docs)
+        else:
+            scores = score_chunks(question, _retrieval_query(state["messages"]) or question, docs)
+        kept, _ = pack_chunks(question, docs, scores, COMPRESS_CONFIG["max_tokens"])
+        if not kept:
+            # Nothing scored: keep chunks in retrieval order rather than answer from nothing
+            kept, _ = pack_chunks(question, docs, [1.0] * len(docs), COMPRESS_CONFIG["max_tokens"])
+        compressed_context = "\n\n".join(kept)
+        tracing.annotate(kept_chunks=len(kept), chunks=len(docs))
+        print(f"✂️  Kept {len(kept)} of {len(docs)} chunks")
     
-    compression_ratio = len(compressed_context) / len(current_context)
+    compression_ratio = len(compressed_context) / len(current_context) if current_context else 1.0
     print(f"📏 Compressed context length: {len(compressed_context)} characters")
     print(f"📊 Compression ratio: {compression_ratio:.2%}")
+    tracing.annotate(compressed_chars=len(compressed_context), compress_mode=mode)
     
     # Replace the last message (retrieved context) with compressed version
-    return {"messages": [AIMessage(content=compressed_context)]}
+    return {"messages": [AIMessage(content=compressed_context)], "tokens_used": tokens_used}
@@ -1,9 +1,14 @@
 """
 Shared configuration for the Medical RAG system.
 Loads environment variables once and makes them available to all modules.
+
+Importing this module is cheap and never fails. The OpenAI key is checked, and chat
+models are created, on first use, so CLI tools and worker processes that never call a
+model start without paying for (or requiring) them.
 """
 
 from dotenv import load_dotenv
+from functools import lru_cache
 import os
 
 # Load environment variables once
@@ -13,11 +18,30 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
 
-# Validate required environment variables
-if not OPENAI_API_KEY:
-    raise ValueError(
-        "OPENAI_API_KEY not found in environment variables. "
-        "Please set it in your .env file."
-    )
+# LLM response cache mode: record, replay or passthrough (see llm_cache.py)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "passthrough")
+
+CHAT_MODEL = "openai:gpt-4o"
+
+
+@lru_cache(maxsize=None)
+def require_openai_api_key() -> str:
+    """Return the OpenAI API key, raising if it is not set."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError(
+            "OPENAI_API_KEY not found in environment variables. "
+            "Please set it in your .env file."
+        )
+    print("✅ Environment variables loaded successfully")
+    return api_key
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model: str = CHAT_MODEL, temperature: float = 0):
+    """Return the shared chat model for a model name and temperature, created on first use."""
+    # Imported here, and looked up on every first use, so importing a node stays cheap
+    from langchain.chat_models import init_chat_model
 
-print("✅ Environment variables loaded successfully")
+    require_openai_api_key()
+    return init_chat_model(model, temperature=temperature)
@@ -4,6 +4,7 @@ This extends MessagesState to include question_id for better judge matching
 """
 
 from typing import Annotated
+import operator
 from typing_extensions import TypedDict
 from langgraph.graph.message import add_messages
 from langchain_core.messages import BaseMessage
@@ -18,6 +19,19 @@ class MedicalRAGState(TypedDict):
     # Custom field for question identification
     question_id: str
     
+    # Patient whose records the retrieval tool searches
+    patient_id: str
+    
+    # Execution budget for the question (max_rewrites, deadline, max_tokens), see budget.py
+    budget: dict
+    
+    # Rewrites done so far, and model tokens spent by the nodes (summed across updates)
+    rewrite_count: int
+    tokens_used: Annotated[int, operator.add]
+    
+    # Latest grade of the retrieved documents: 1 relevant, 0 not relevant
+    documents_relevant: int
+    
     # Optional: Store original question text for reference
     original_question: str
     
@@ -0,0 +1,160 @@
+"""
+Embedding Cache for Medical RAG System
+Persistent, content-addressed cache that sits in front of any LangChain embedding model.
+"""
+
+from langchain_core.embeddings import Embeddings
+from array import array
+from functools import lru_cache
+from typing import Dict, List, Optional
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+EMBEDDING_CACHE_CONFIG = {
+    "path": "./cache/embeddings.sqlite",
+    "max_entries": 200_000,  # Least recently used vectors are evicted beyond this
+    "touch_flush_every": 1000,  # Buffered last_used updates written to disk in batches of this size
+}
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH_SIZE = 500
+
+
+def text_key(text: str) -> str:
+    """Content address of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that stores every vector on disk, keyed by (model, sha256 of text)."""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, path: str = None, max_entries: int = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = path or EMBEDDING_CACHE_CONFIG["path"]
+        self.max_entries = max_entries or EMBEDDING_CACHE_CONFIG["max_entries"]
+        self.touch_flush_every = EMBEDDING_CACHE_CONFIG["touch_flush_every"]
+        self.hits = 0
+        self.misses = 0
+        # last_used times of cache hits not yet written, so lookups stay read-only
+        self._touched: Dict[str, float] = {}
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, key)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, calling the underlying model only for texts not seen before."""
+        keys = [text_key(text) for text in texts]
+        vectors = self._lookup(keys)
+
+        # Embed each missing text once, even if it appears several times in the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_entries = dict(zip(missing.keys(), new_vectors))
+            self._store(new_entries)
+            vectors.update(new_entries)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query through the same cache."""
+        return self.embed_documents([text])[0]
+
+    def cached_vectors(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached vectors for texts, None where a text has not been embedded. Never calls the model."""
+        keys = [text_key(text) for text in texts]
+        vectors = self._lookup(keys)
+        return [vectors.get(key) for key in keys]
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Fetch cached vectors in batches and mark them as recently used.
+
+        Hits are only recorded in memory. They reach disk in batches, and before every
+        store so eviction sees them, which keeps the query path free of SQLite writes.
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            for start in range(0, len(unique_keys), _LOOKUP_BATCH_SIZE):
+                batch = unique_keys[start:start + _LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [self.model_name, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                    self._touched[key] = now
+
+            if len(self._touched) >= self.touch_flush_every:
+                self._flush_touched()
+                self._conn.commit()
+
+        return found
+
+    def _flush_touched(self):
+        """Write buffered last_used times. The caller holds the lock and commits."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                [(last_used, self.model_name, key) for key, last_used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _store(self, entries: Dict[str, List[float]]):
+        """Persist new vectors and evict the least recently used ones beyond the size cap."""
+        now = time.time()
+        with self._lock:
+            self._flush_touched()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model_name, key, array("f", vector).tobytes(), now) for key, vector in entries.items()],
+            )
+
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE (model, key) IN "
+                    "(SELECT model, key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit and miss counters for this process."""
+        return {"hits": self.hits, "misses": self.misses}
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(model: str = EMBEDDING_MODEL) -> CachedEmbeddings:
+    """Return the shared, disk-cached embedding model for the given OpenAI model name."""
+    from langchain_openai import OpenAIEmbeddings
+
+    return CachedEmbeddings(OpenAIEmbeddings(model=model), model_name=model)
@@ -4,12 +4,13 @@ Generates comprehensive medical answers from retrieved patient data.
 """
 
 from langgraph.graph import MessagesState
-from langchain.chat_models import init_chat_model
+from langchain_core.runnables import RunnableConfig
 from custom_state import MedicalRAGState
-from typing import Dict, Any
+from budget import latest_context, usage_tokens
+from typing import Dict, Any, Optional
 
 # Load shared configuration (includes dotenv loading)
-import config
+from config import get_chat_model
 
 GENERATE_PROMPT = (
     "You are a medical assistant helping healthcare professionals analyze patient data. "
@@ -23,15 +24,18 @@ GENERATE_PROMPT = (
     "Medical Answer:"
 )
 
-# Initialize the health expert model
-expert_model = init_chat_model("openai:gpt-4o", temperature=0)
-
-def generate_answer(state: MedicalRAGState) -> Dict[str, Any]:
-    """Generate a medical answer based on patient data."""
+def generate_answer(state: MedicalRAGState, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """Generate a medical answer based on patient data.
+    
+    The node's config is passed to the model so that, when the graph is streamed with
+    stream_mode="messages", answer tokens reach the caller as they are generated.
+    The answer always runs, even over budget, using the latest retrieved context.
+    """
     question = state["messages"][0].content
-    context = state["messages"][-1].content
+    context_message = latest_context(state["messages"]) or state["messages"][-1]
+    context = context_message.content
     
     prompt = GENERATE_PROMPT.format(question=question, context=context)
-    response = expert_model.invoke([{"role": "user", "content": prompt}])
+    response = get_chat_model().invoke([{"role": "user", "content": prompt}], config)
     
-    return {"messages": [response]}
+    return {"messages": [response], "tokens_used": usage_tokens(response)}
@@ -3,10 +3,22 @@ Document Grader for Medical RAG System
 Evaluates whether retrieved documents are relevant to the medical question.
 """
 
-from langchain.chat_models import init_chat_model
 from custom_state import MedicalRAGState
-from typing import Dict, Any, Literal
+from reranker import COHERE_METHOD
+from lab_store import LAB_TOOL_NAME
+from budget import budget_exhausted, rewrites_exhausted, report_exhausted, usage_tokens
+from collections import Counter
+from typing import Dict, Any, List, Literal, Optional, Tuple
+import threading
 import config
+import tracing
+
+GRADER_CONFIG = {
+    "mode": "score_gate",   # "score_gate" decides from rerank scores when clear-cut, "llm" always asks GPT-4o
+    "accept_score": 0.5,    # Top rerank score at or above this is clearly relevant
+    "reject_score": 0.05,   # Top rerank score below this is clearly irrelevant
+    "accept_gap": 0.3,      # A top score this far above the runner-up is also accepted
+}
 
 GRADER_PROMPT = """
 You are a medical document relevance grader. Your task is to assess whether retrieved medical documents 
@@ -24,31 +36,123 @@ Instructions:
 
 Decision (yes/no):"""
 
-# Initialize the grader model
-grader_model = init_chat_model("openai:gpt-4o", temperature=0)
+# How often the score gate decided on its own vs. deferred to the LLM grader
+_gate_stats = Counter()
+_gate_stats_lock = threading.Lock()
+
+
+def get_gate_stats() -> Dict[str, int]:
+    """Return counts of score-gate accepts, rejects and LLM grader calls."""
+    with _gate_stats_lock:
+        return {key: _gate_stats[key] for key in ("accepted", "rejected", "llm")}
+
 
-def grade_documents(state: MedicalRAGState) -> Literal[1, 0]:
+def _record_gate(outcome: str):
+    with _gate_stats_lock:
+        _gate_stats[outcome] += 1
+
+
+def _rerank_scores(message) -> Optional[List[float]]:
+    """Cohere rerank scores of the retrieved documents, best first, or None if unavailable."""
+    docs = getattr(message, "artifact", None)
+    if not docs:
+        return None
+    
+    scores = []
+    for doc in docs:
+        metadata = getattr(doc, "metadata", None) or {}
+        # Local fallback scores are not on Cohere's scale and cannot be gated
+        if "rerank_score" not in metadata or metadata.get("rerank_method") != COHERE_METHOD:
+            return None
+        scores.append(float(metadata["rerank_score"]))
+    
+    return sorted(scores, reverse=True)
+
+
+def score_gate(scores: List[float]) -> Optional[int]:
+    """Decide relevance from rerank scores alone.
+    
+    Returns 1 or 0 when the scores are clear-cut, or None when they fall in the
+    ambiguous middle band and the LLM grader should decide.
+    """
+    top = scores[0]
+    runner_up = scores[1] if len(scores) > 1 else 0.0
+    
+    if top >= GRADER_CONFIG["accept_score"]:
+        return 1
+    if top < GRADER_CONFIG["reject_score"]:
+        return 0
+    if top - runner_up >= GRADER_CONFIG["accept_gap"]:
+        return 1
+    return None
+
+def grade_documents(state: MedicalRAGState) -> Dict[str, Any]:
     """
     Determines whether the retrieved documents are relevant to the question.
     
+    Once the budget is spent, or the rewrite limit is reached, the documents are
+    passed on as the best available context instead of rewriting again.
+    
     Args:
         state: Current state containing messages
         
     Returns:
-        1 if relevant documents (proceed to generate_answer)
-        0 if not relevant (proceed to rewrite_question)
+        documents_relevant: 1 if relevant (proceed to generate_answer), 0 if not
+        (proceed to rewrite_question), and the tokens the LLM grader spent
+    """
+    reason = budget_exhausted(state)
+    if reason:
+        report_exhausted("grade_documents", reason)
+        return {"documents_relevant": 1}
+    
+    decision, tokens_used = _grade(state)
+    if decision == 0 and rewrites_exhausted(state):
+        report_exhausted("grade_documents", "rewrites")
+        decision = 1
+    return {"documents_relevant": decision, "tokens_used": tokens_used}
+
+
+def route_graded(state: MedicalRAGState) -> Literal[1, 0]:
+    """Route on the grade written by grade_documents."""
+    return state["documents_relevant"]
+
+
+def _grade(state: MedicalRAGState) -> Tuple[Literal[1, 0], int]:
+    """Grade the last tool result: lab lookups by presence, documents by score gate or LLM.
+    
+    Returns the decision and the tokens spent, which are 0 unless the LLM grader ran.
     """
+    # Lab lookups are exact matches on analyte, flag or panel, so any result is relevant
+    last_message = state["messages"][-1]
+    if getattr(last_message, "name", None) == LAB_TOOL_NAME:
+        decision = 1 if getattr(last_message, "artifact", None) else 0
+        tracing.annotate(grader="lab_lookup")
+        print(f"🧪 Lab lookup: {'results found' if decision else 'no matching results'}")
+        return decision, 0
+    
+    if GRADER_CONFIG["mode"] == "score_gate":
+        scores = _rerank_scores(state["messages"][-1])
+        decision = score_gate(scores) if scores else None
+        if decision is not None:
+            _record_gate("accepted" if decision else "rejected")
+            tracing.annotate(grader="score_gate", top_rerank_score=scores[0])
+            print(f"🚦 Score gate: {'relevant' if decision else 'not relevant'} (top rerank score {scores[0]:.3f})")
+            return decision, 0
+    
+    _record_gate("llm")
+    tracing.annotate(grader="llm")
+    
     question = state["messages"][0].content
     # Get documents from the last message (retrieval results)
     documents = state["messages"][-1].content if len(state["messages"]) > 1 else ""
     
     prompt = GRADER_PROMPT.format(question=question, documents=documents)
-    response = grader_model.invoke([{"role": "user", "content": prompt}])
+    response = config.get_chat_model().invoke([{"role": "user", "content": prompt}])
     
     # Parse the response
     grade = response.content.strip().lower()
     
     if "yes" in grade:
-        return 1  # Relevant - proceed to answer generation
+        return 1, usage_tokens(response)  # Relevant - proceed to answer generation
     else:
-        return 0  # Not relevant - rewrite question and retry
+        return 0, usage_tokens(response)  # Not relevant - rewrite question and retry
@@ -0,0 +1,43 @@
+"""
+Hybrid Retriever - Fuses vector search with BM25 keyword search using reciprocal rank fusion.
+When the vector search is category-routed, keyword matches are restricted to the same categories.
+"""
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from query_router import RoutedVectorRetriever
+from typing import List, Optional
+import tracing
+
+
+class HybridRetriever(BaseRetriever):
+    """First-stage retriever that combines a vector retriever with a BM25 index."""
+
+    vector_retriever: BaseRetriever
+    bm25_index: BM25Index
+    bm25_k: int = 25
+    rrf_k: int = 60
+    k: int = 15
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _fuse(self, query: str, vector_docs: List[Document], categories: Optional[List[str]] = None) -> List[Document]:
+        keyword_docs = [doc for doc, _ in self.bm25_index.search(query, k=self.bm25_k, categories=categories)]
+        tracing.annotate(vector_candidates=len(vector_docs), keyword_candidates=len(keyword_docs))
+        return reciprocal_rank_fusion([vector_docs, keyword_docs], k=self.rrf_k, limit=self.k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if isinstance(self.vector_retriever, RoutedVectorRetriever):
+            return self._fuse(query, *self.vector_retriever.search(query))
+        vector_docs = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self._fuse(query, vector_docs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if isinstance(self.vector_retriever, RoutedVectorRetriever):
+            return self._fuse(query, *await self.vector_retriever.asearch(query))
+        vector_docs = await self.vector_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self._fuse(query, vector_docs)
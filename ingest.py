@@ -0,0 +1,264 @@
+"""
+Bulk Ingestion for Medical RAG System
+Embeds and indexes many patients' data/<patient> trees in one resumable run.
+
+Files from all patients are streamed through a reader pool and chunked. Chunks are sent
+to the embedding API in batches sized by chunk count and characters. A limited number of
+requests are in flight at once, and 429 responses are retried with exponential backoff.
+Embedded vectors land in the embedding cache, so each patient's collection is then written
+without further API calls, and their lab tables are parsed into the lab store. Finished
+patients are checkpointed, so a crashed run resumes where it stopped.
+
+Usage:
+    python ingest.py                 # every patient under data/
+    python ingest.py drapoel other   # selected patients
+"""
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+import argparse
+import json
+import os
+import random
+import time
+
+import openai
+
+from retriever import (
+    PERSIST_DIRECTORY, add_in_batches, delete_in_batches, generate_file_checksums,
+    generate_index_checksum, load_bm25_index, open_vectorstore, plan_sync, read_document, split_documents,
+    _get_collection_metadata, _set_collection_metadata,
+)
+from embedding_cache import get_embeddings
+from atomic_write import atomic_write
+from lab_store import load_lab_store
+
+INGEST_CONFIG = {
+    "reader_workers": 8,              # Threads reading and chunking files
+    "batch_size": 256,                # Max chunks per embedding request
+    "batch_chars": 300_000,           # Max characters per embedding request, well under the token limit
+    "embedding_concurrency": 4,       # Embedding requests in flight at once
+    "max_retries": 8,                 # Attempts per batch on rate limiting
+    "backoff_seconds": 1.0,           # First wait after a 429, doubled on every retry
+    "max_backoff_seconds": 60.0,
+    "checkpoint_path": os.path.join(PERSIST_DIRECTORY, "ingest_checkpoint.json"),
+}
+
+
+def discover_patients(data_directory: str = "data") -> List[str]:
+    """Every patient ID with a directory under data/."""
+    return sorted(
+        name for name in os.listdir(data_directory)
+        if os.path.isdir(os.path.join(data_directory, name))
+    )
+
+
+def load_checkpoint(path: str) -> Dict[str, str]:
+    """Patient ID to the index checksum (data and chunking settings) it was fully ingested at."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, str]):
+    with atomic_write(path) as f:
+        json.dump(checkpoint, f)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return isinstance(error, openai.RateLimitError) or getattr(error, "status_code", None) == 429
+
+
+def embed_with_backoff(embeddings, texts: List[str]):
+    """Embed a batch through the cache, retrying with jittered exponential backoff on 429s."""
+    for attempt in range(INGEST_CONFIG["max_retries"]):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == INGEST_CONFIG["max_retries"] - 1:
+                raise
+            delay = min(INGEST_CONFIG["backoff_seconds"] * 2 ** attempt, INGEST_CONFIG["max_backoff_seconds"])
+            delay *= random.uniform(0.5, 1.0)
+            print(f"⏳ Rate limited, retrying batch of {len(texts)} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def bounded_map(executor: ThreadPoolExecutor, fn, items: Iterable, window: int) -> Iterator:
+    """Like executor.map, in order, but with at most window tasks submitted at a time."""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, *item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class PatientJob:
+    """Ingestion state of one patient: what changed, its chunks and its outstanding batches."""
+
+    def __init__(self, patient_id: str):
+        self.patient_id = patient_id
+        self.collection_name = f"patient_{patient_id}"
+        file_checksums = self.file_checksums = generate_file_checksums(patient_id)
+        self.checksum = generate_index_checksum(patient_id, file_checksums)
+        self.vectorstore = open_vectorstore(self.collection_name)
+        self.up_to_date = _get_collection_metadata(self.vectorstore).get("checksum") == self.checksum
+        if self.up_to_date:
+            self.changed_files, self.stale_ids = {}, []
+        else:
+            self.changed_files, self.stale_ids, _ = plan_sync(self.vectorstore, file_checksums)
+        self.chunks_by_file: Dict[str, list] = {}
+        self.files_read = 0
+        self.unbatched_chunks = 0
+        self.outstanding_batches = 0
+
+    @property
+    def ready(self) -> bool:
+        """Whether every changed file was read and all of its chunks are embedded."""
+        return (self.files_read == len(self.changed_files)
+                and self.unbatched_chunks == 0 and self.outstanding_batches == 0)
+
+    def write(self, batch_size: int) -> int:
+        """Write the patient's collection. Vectors come from the embedding cache. Returns chunks written."""
+        delete_in_batches(self.vectorstore, self.stale_ids)
+
+        # A file's chunks are always written together, so an interrupted run never leaves
+        # a file half-indexed under its current checksum
+        written, batch = 0, []
+        for file_path in sorted(self.chunks_by_file):
+            batch.extend(self.chunks_by_file[file_path])
+            if len(batch) >= batch_size:
+                add_in_batches(self.vectorstore, batch)
+                written, batch = written + len(batch), []
+        add_in_batches(self.vectorstore, batch)
+        written += len(batch)
+
+        _set_collection_metadata(self.vectorstore, {"checksum": self.checksum})
+        load_bm25_index(self.vectorstore, self.collection_name, self.checksum)
+        load_lab_store(self.patient_id, self.file_checksums)
+        return written
+
+
+def _read_and_split(job: PatientJob, file_path: str, source_hash: str):
+    return job, file_path, split_documents(read_document(file_path, source_hash))
+
+
+def ingest(patient_ids: List[str], checkpoint_path: Optional[str] = None, restart: bool = False,
+           reader_workers: Optional[int] = None, batch_size: Optional[int] = None,
+           batch_chars: Optional[int] = None, embedding_concurrency: Optional[int] = None) -> Dict[str, float]:
+    """Ingest patients, skipping those already checkpointed at their current index checksum.
+
+    Returns:
+        Dictionary with patient, file and chunk counts, elapsed seconds and chunks per second
+    """
+    checkpoint_path = checkpoint_path or INGEST_CONFIG["checkpoint_path"]
+    reader_workers = reader_workers or INGEST_CONFIG["reader_workers"]
+    batch_size = batch_size or INGEST_CONFIG["batch_size"]
+    batch_chars = batch_chars or INGEST_CONFIG["batch_chars"]
+    embedding_concurrency = embedding_concurrency or INGEST_CONFIG["embedding_concurrency"]
+
+    checkpoint = {} if restart else load_checkpoint(checkpoint_path)
+    embeddings = get_embeddings()
+    stats = {"patients": 0, "skipped": 0, "files": 0, "chunks": 0}
+    start = time.perf_counter()
+
+    in_flight: "deque[tuple[Future, List[PatientJob]]]" = deque()
+    open_jobs: List[PatientJob] = []
+
+    def finish_ready_jobs():
+        for job in [job for job in open_jobs if job.ready]:
+            stats["chunks"] += job.write(batch_size)
+            stats["patients"] += 1
+            open_jobs.remove(job)
+            checkpoint[job.patient_id] = job.checksum
+            save_checkpoint(checkpoint_path, checkpoint)
+            elapsed = time.perf_counter() - start
+            print(f"✅ {job.patient_id} | {stats['patients']} patients | {stats['chunks']} chunks | "
+                  f"{stats['chunks'] / elapsed:.1f} chunks/s")
+
+    def wait_for_batch():
+        future, jobs = in_flight.popleft()
+        future.result()
+        for job in jobs:
+            job.outstanding_batches -= 1
+        finish_ready_jobs()
+
+    def submit_batch(batch: list):
+        jobs = list({id(job): job for job, _ in batch}.values())
+        for job in jobs:
+            job.outstanding_batches += 1
+        for job, _ in batch:
+            job.unbatched_chunks -= 1
+        texts = [doc.page_content for _, doc in batch]
+        in_flight.append((embed_executor.submit(embed_with_backoff, embeddings, texts), jobs))
+        while len(in_flight) > embedding_concurrency:
+            wait_for_batch()
+
+    def pending_files() -> Iterator[tuple]:
+        for patient_id in patient_ids:
+            if checkpoint.get(patient_id) == generate_index_checksum(patient_id):
+                stats["skipped"] += 1
+                continue
+            print(f"📥 Planning {patient_id}")
+            job = PatientJob(patient_id)
+            open_jobs.append(job)
+            for file_path, source_hash in sorted(job.changed_files.items()):
+                yield job, file_path, source_hash
+
+    with ThreadPoolExecutor(max_workers=reader_workers, thread_name_prefix="reader") as read_executor, \
+            ThreadPoolExecutor(max_workers=embedding_concurrency, thread_name_prefix="embed") as embed_executor:
+        batch, batch_length = [], 0
+        for job, file_path, chunks in bounded_map(read_executor, _read_and_split, pending_files(), reader_workers * 4):
+            job.chunks_by_file[file_path] = chunks
+            job.files_read += 1
+            stats["files"] += 1
+            for doc in chunks:
+                if batch and (len(batch) >= batch_size or batch_length + len(doc.page_content) > batch_chars):
+                    submit_batch(batch)
+                    batch, batch_length = [], 0
+                batch.append((job, doc))
+                job.unbatched_chunks += 1
+                batch_length += len(doc.page_content)
+            finish_ready_jobs()
+
+        if batch:
+            submit_batch(batch)
+        while in_flight:
+            wait_for_batch()
+        finish_ready_jobs()
+
+    elapsed = time.perf_counter() - start
+    stats.update(elapsed_seconds=elapsed, chunks_per_second=stats["chunks"] / elapsed if elapsed else 0.0)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest patient data into the vector store")
+    parser.add_argument("patients", nargs="*", help="Patient IDs to ingest (default: every patient under data/)")
+    parser.add_argument("--readers", type=int, default=INGEST_CONFIG["reader_workers"], help="File reader threads")
+    parser.add_argument("--batch-size", type=int, default=INGEST_CONFIG["batch_size"], help="Max chunks per embedding request")
+    parser.add_argument("--batch-chars", type=int, default=INGEST_CONFIG["batch_chars"], help="Max characters per embedding request")
+    parser.add_argument("--concurrency", type=int, default=INGEST_CONFIG["embedding_concurrency"], help="Embedding requests in flight")
+    parser.add_argument("--checkpoint", default=INGEST_CONFIG["checkpoint_path"], help="Checkpoint file")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and re-check every patient")
+    args = parser.parse_args()
+
+    patient_ids = args.patients or discover_patients()
+    print(f"📚 Ingesting {len(patient_ids)} patients")
+    stats = ingest(patient_ids, checkpoint_path=args.checkpoint, restart=args.restart,
+                   reader_workers=args.readers, batch_size=args.batch_size,
+                   batch_chars=args.batch_chars, embedding_concurrency=args.concurrency)
+
+    embedding_stats = get_embeddings().stats()
+    print(f"\n🎉 Ingested {stats['patients']} patients ({stats['skipped']} already up to date) | "
+          f"{stats['files']} files | {stats['chunks']} chunks in {stats['elapsed_seconds']:.1f}s | "
+          f"{stats['chunks_per_second']:.1f} chunks/s")
+    print(f"🧮 Embedding cache - Hits: {embedding_stats['hits']} | Misses: {embedding_stats['misses']}")
+
+
+if __name__ == "__main__":
+    main()
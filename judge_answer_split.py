@@ -1,10 +1,18 @@
 from langgraph.graph import MessagesState
-from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda, RunnableParallel
 from custom_state import MedicalRAGState
-from typing import Dict, Any
+from budget import latest_context
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, Optional
 import json
 import os
+import random
+import threading
+
+import config
 
 
 CONTEXT_JUDGE_PROMPT = """
@@ -34,6 +42,9 @@ Evaluation Rules:
     - Context contains more than 50% irrelevant information that doesn't help answer the question. -2 points total.
     - If a more recent document clearly updates a fact and SYSTEM_CONTEXT omits it, subtract an additional -2 once total.
 3) Floor: minimum Context Score = 0.
+
+Explain your deductions briefly, then end with a final line in exactly this format, where N is the score:
+Context Score: N
 """
 
 ANSWER_JUDGE_PROMPT = """
@@ -53,10 +64,14 @@ Evaluation Rules:
     - Missing a REQUIRED information present in the golden answer: **-2 each**
     - Do NOT penalize for minor language issues if all required info is present and would make sens to a medical professional.
     - Floor: minimum Answer Score = 1
+
+Explain your deductions briefly, then end with a final line in exactly this format, where N is the score:
+Final Score: N
 """
 
+@lru_cache(maxsize=None)
 def load_golden_answers(patient_id: str = "drapoel"):
-    """Load golden answers from the JSONL file."""
+    """Load golden answers from the JSONL file, once per patient."""
     golden_file = f"golden_data/{patient_id}/golden.jsonl"
     if not os.path.exists(golden_file):
         return {}
@@ -88,17 +103,13 @@ def load_golden_answers(patient_id: str = "drapoel"):
         return {}
 
 
-# Load golden answers from JSONL file
-golden_reference_answers = load_golden_answers("drapoel")
-
-
 def _get_judgment_data(state: MedicalRAGState):
     """Helper function to extract common judgment data from state."""
     question_id = state.get("question_id")
     if not question_id:
         return None, "No question ID available for judgment."
     
-    golden_data = golden_reference_answers.get(question_id)
+    golden_data = load_golden_answers("drapoel").get(question_id)
     if not golden_data:
         return None, "No golden reference available for this question ID."
     
@@ -112,8 +123,7 @@ def _get_judgment_data(state: MedicalRAGState):
 
 def _invoke_judge_model(prompt: str) -> str:
     """Helper function to invoke the judgment model."""
-    judge_model = init_chat_model("openai:gpt-4o", temperature=0)
-    response = judge_model.invoke([{"role": "user", "content": prompt}])
+    response = config.get_chat_model().invoke([{"role": "user", "content": prompt}])
     return response.content
 
 
@@ -123,7 +133,9 @@ def judge_context(state: MedicalRAGState) -> Dict[str, Any]:
     if error:
         return {"context_judgment": error}
     
-    context = state.get("retrieved_context", state["messages"][-2].content if len(state["messages"]) > 1 else "")
+    # The context the answer was generated from, which precedes the answer unless it was cut short by the budget
+    context_message = latest_context(state["messages"][:-1])
+    context = state.get("retrieved_context", context_message.content if context_message else "")
     
     ideal_context = "\n".join([f"- {item}" for item in data["golden_data"]["ideal_context"]])
 
@@ -154,15 +166,69 @@ def judge_answer_accuracy(state: MedicalRAGState) -> Dict[str, Any]:
     return {"answer_judgment": _invoke_judge_model(prompt)}
 
 
+# Both judges are independent GPT-4o calls, so they run concurrently
+_parallel_judges = RunnableParallel(
+    context=RunnableLambda(judge_context),
+    answer=RunnableLambda(judge_answer_accuracy),
+)
+
+
+def run_judges(state: MedicalRAGState) -> Dict[str, str]:
+    """Run the context and answer judges concurrently and return both judgments."""
+    results = _parallel_judges.invoke(state)
+    return {
+        "context_judgment": results["context"].get("context_judgment", "No context judgment available"),
+        "answer_judgment": results["answer"].get("answer_judgment", "No answer judgment available"),
+    }
+
+
+def format_judge_feedback(judgments: Dict[str, str]) -> str:
+    """Combine both judgments into the feedback text stored with the results."""
+    return f"""=== CONTEXT EVALUATION ===
+{judgments['context_judgment']}
+
+=== ANSWER EVALUATION ===
+{judgments['answer_judgment']}"""
+
+
 def judge_answer(state: MedicalRAGState) -> Dict[str, Any]:
     """Combined judge that runs both context and answer evaluations."""
-    context_result = judge_context(state)
-    answer_result = judge_answer_accuracy(state)
+    combined_feedback = format_judge_feedback(run_judges(state))
     
-    combined_feedback = f"""=== CONTEXT EVALUATION ===
-{context_result.get('context_judgment', 'No context judgment available')}
+    return {"messages": [AIMessage(content=combined_feedback)]}
 
-=== ANSWER EVALUATION ===
-{answer_result.get('answer_judgment', 'No answer judgment available')}"""
+
+class JudgeWorker:
+    """Background worker queue that judges finished answers off the answer critical path.
     
-    return {"messages": [AIMessage(content=combined_feedback)]}
+    Each judged answer is appended to a JSONL file as soon as both judges finish.
+    A sample rate below 1.0 judges only a random share of submissions, e.g. for production traffic.
+    """
+    
+    def __init__(self, output_path: str = "judgments.jsonl", max_workers: int = 4, sample_rate: float = 1.0):
+        self.output_path = output_path
+        self.sample_rate = sample_rate
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="judge")
+        self._write_lock = threading.Lock()
+    
+    def submit(self, state: MedicalRAGState) -> Optional[Future]:
+        """Queue a final graph state for judging. Returns a future with the feedback text, or None if not sampled."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        return self._executor.submit(self._judge, dict(state))
+    
+    def _judge(self, state: MedicalRAGState) -> str:
+        judgments = run_judges(state)
+        record = {
+            "question_id": state.get("question_id"),
+            "judged_at": datetime.now().isoformat(),
+            **judgments,
+        }
+        with self._write_lock:
+            with open(self.output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return format_judge_feedback(judgments)
+    
+    def close(self, wait: bool = True):
+        """Stop accepting work, optionally waiting for queued judgments to finish."""
+        self._executor.shutdown(wait=wait)
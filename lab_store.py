@@ -0,0 +1,348 @@
+"""
+Lab Results Store for Medical RAG System
+Parses the pipe tables in data/<patient>/labs/*.md into a small columnar store per patient.
+
+Each row holds the test name, normalised analyte, value, unit, reference range, flag,
+panel and date, and is indexed by analyte, flag and panel. The store backs the
+lookup_patient_labs tool: questions about lab values and abnormal flags are answered
+with an exact, tiny context, without embedding, vector search or reranking.
+
+Stores are persisted next to the vector store, keyed by a checksum of the lab files,
+and kept in memory once loaded.
+
+Print a patient's parsed lab results:
+    python lab_store.py drapoel
+    python lab_store.py drapoel --flag abnormal
+"""
+
+from langchain_core.tools import StructuredTool
+from langgraph.prebuilt import InjectedState
+from pydantic import BaseModel, Field
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from typing import Annotated, Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import re
+import threading
+
+from atomic_write import atomic_write
+from markdown_splitter import parse_sections, source_category
+from retriever import PERSIST_DIRECTORY, generate_file_checksums, generate_patient_data_checksum
+from retriever_pool import validate_patient_id
+import tracing
+
+LAB_TOOL_NAME = "lookup_patient_labs"
+
+LAB_STORE_CONFIG = {
+    "max_patients": 256,   # Lab stores kept in memory; least recently used patients are dropped beyond this
+}
+
+LAB_COLUMNS = ("test", "analyte", "value", "numeric", "unit", "range", "flag", "panel", "panel_title", "date", "source")
+
+DATE_PATTERN = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+NUMBER_PATTERN = re.compile(r"^[<>≤≥~]?\s*(-?\d+(?:\.\d+)?)")
+TRAILING_PARENTHESIS_PATTERN = re.compile(r"^(.*?)\s*\(([^()]*)\)\s*$")
+UNIT_PATTERN = re.compile(r"[/%×³⁶]|^(fL|pg|mg|g|U|IU|mmol|ng|µg|mcg)$")
+
+# Common names of the same analyte, mapped to one key
+ANALYTE_ALIASES = {
+    "hba1c": "a1c", "hemoglobin_a1c": "a1c", "a1c": "a1c",
+    "thyroid_stimulating_hormone": "tsh",
+    "t4": "free_t4", "ft4": "free_t4",
+    "ldl": "ldl_cholesterol", "hdl": "hdl_cholesterol", "vldl": "vldl_cholesterol",
+    "non_hdl": "non_hdl_cholesterol",
+    "vitamin_d": "vitamin_d", "vitamin_d_25_oh": "vitamin_d", "vitamin_d_25_oh_total": "vitamin_d", "vit_d": "vitamin_d",
+    "crp": "hs_crp", "c_reactive_protein": "hs_crp",
+    "ast_sgot": "ast", "sgot": "ast", "alt_sgpt": "alt", "sgpt": "alt",
+}
+
+FLAG_ALIASES = {
+    "h": "H", "high": "H", "elevated": "H",
+    "l": "L", "low": "L",
+    "normal": "", "none": "", "": "",
+}
+
+
+def normalise_analyte(name: str) -> str:
+    """Canonical analyte key for a test name, e.g. "HbA1c (%)" -> "a1c", "LDL Cholesterol" -> "ldl_cholesterol"."""
+    key = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+    return ANALYTE_ALIASES.get(key, key)
+
+
+def normalise_flag(flag: str) -> str:
+    """"**H**" and "*H*" become "H", an empty cell becomes "" (within range)."""
+    flag = flag.strip().strip("*").strip()
+    return FLAG_ALIASES.get(flag.lower(), flag)
+
+
+def split_unit(name: str) -> Tuple[str, str]:
+    """Split "TSH (µIU/mL)" into ("TSH", "µIU/mL"). Names without a unit are returned as they are."""
+    match = TRAILING_PARENTHESIS_PATTERN.match(name)
+    if match and UNIT_PATTERN.search(match.group(2)):
+        return match.group(1), match.group(2)
+    return name, ""
+
+
+def _cells(line: str) -> List[str]:
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+def parse_lab_table(table: str) -> List[Dict[str, str]]:
+    """Parse a Test | Result | Reference Range | Flag table into rows. Other tables yield no rows."""
+    lines = [line for line in table.splitlines() if line.strip()]
+    if len(lines) < 3:
+        return []
+    header = [cell.lower() for cell in _cells(lines[0])]
+
+    def column(*names: str) -> Optional[int]:
+        return next((index for index, cell in enumerate(header) if any(name in cell for name in names)), None)
+
+    result_column = column("result", "value")
+    range_column = column("range")
+    flag_column = column("flag")
+    if result_column is None:
+        return []
+    _, header_unit = split_unit(header[range_column]) if range_column is not None else ("", "")
+
+    rows: List[Dict[str, str]] = []
+    for line in lines[2:]:
+        cells = _cells(line)
+        cells += [""] * (len(header) - len(cells))
+        name = cells[0].strip("*").strip()
+        value = cells[result_column]
+        range_text = cells[range_column] if range_column is not None else ""
+        flag = cells[flag_column] if flag_column is not None else ""
+
+        # A row with no test and no result continues the previous row's reference range
+        if not name and not value and rows:
+            rows[-1]["range"] = "; ".join(part for part in (rows[-1]["range"], range_text) if part)
+            continue
+
+        test, unit = split_unit(name)
+        rows.append({"test": test, "value": value, "unit": unit or header_unit,
+                     "range": range_text, "flag": normalise_flag(flag)})
+    return rows
+
+
+def parse_lab_file(path: str, text: str) -> List[Dict[str, object]]:
+    """Every lab result in one file, tagged with its panel, panel title and date."""
+    panel = os.path.splitext(os.path.basename(path))[0]
+    date_match = DATE_PATTERN.search(text)
+    date = date_match.group(1) if date_match else ""
+
+    results = []
+    for section in parse_sections(text):
+        for block in section.blocks:
+            if not block.lstrip().startswith("|"):
+                continue
+            for row in parse_lab_table(block):
+                number = NUMBER_PATTERN.match(row["value"])
+                results.append({
+                    **row,
+                    "analyte": normalise_analyte(row["test"]),
+                    "numeric": float(number.group(1)) if number else None,
+                    "panel": panel,
+                    "panel_title": section.path or panel,
+                    "date": date,
+                    "source": path,
+                })
+    return results
+
+
+class LabStore:
+    """Columnar lab results for one patient, indexed by analyte, flag and panel."""
+
+    def __init__(self, columns: Dict[str, list]):
+        self.columns = columns
+        self.by_analyte: Dict[str, List[int]] = defaultdict(list)
+        self.by_flag: Dict[str, List[int]] = defaultdict(list)
+        self.by_panel: Dict[str, List[int]] = defaultdict(list)
+        for index in range(len(self)):
+            self.by_analyte[columns["analyte"][index]].append(index)
+            self.by_flag[columns["flag"][index]].append(index)
+            self.by_panel[columns["panel"][index]].append(index)
+
+    def __len__(self) -> int:
+        return len(self.columns["test"])
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, object]]) -> "LabStore":
+        return cls({column: [row[column] for row in rows] for column in LAB_COLUMNS})
+
+    def row(self, index: int) -> Dict[str, object]:
+        return {column: values[index] for column, values in self.columns.items()}
+
+    def _analyte_indices(self, analyte: str) -> List[int]:
+        key = normalise_analyte(analyte)
+        if key in self.by_analyte:
+            return self.by_analyte[key]
+        # Fall back to a partial match, e.g. "cholesterol" finds every cholesterol analyte
+        return [index for name, indices in self.by_analyte.items() if key in name for index in indices]
+
+    def _flag_indices(self, flag: str) -> List[int]:
+        if flag.strip().lower() == "abnormal":
+            return [index for name, indices in self.by_flag.items() if name for index in indices]
+        return self.by_flag.get(normalise_flag(flag), [])
+
+    def _panel_indices(self, panel: str) -> List[int]:
+        key = panel.strip().lower().replace(" panel", "")
+        if key in self.by_panel:
+            return self.by_panel[key]
+        return [index for index, title in enumerate(self.columns["panel_title"])
+                if key and (key in title.lower() or key in self.columns["panel"][index])]
+
+    def lookup(self, analyte: Optional[str] = None, flag: Optional[str] = None,
+               panel: Optional[str] = None) -> List[Dict[str, object]]:
+        """Rows matching every given criterion, in file order. With no criteria, every row."""
+        selected: Optional[set] = None
+        for value, index_fn in ((analyte, self._analyte_indices), (flag, self._flag_indices),
+                                (panel, self._panel_indices)):
+            if value is None or not value.strip():
+                continue
+            matches = set(index_fn(value))
+            selected = matches if selected is None else selected & matches
+        indices = range(len(self)) if selected is None else sorted(selected)
+        return [self.row(index) for index in indices]
+
+    def save(self, path: str, checksum: str):
+        with atomic_write(path) as f:
+            json.dump({"checksum": checksum, "columns": self.columns}, f)
+
+    @classmethod
+    def load(cls, path: str, checksum: str) -> Optional["LabStore"]:
+        """Load a persisted store, or return None if it is missing or was built from other files."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("checksum") != checksum or set(data.get("columns", {})) != set(LAB_COLUMNS):
+            return None
+        return cls(data["columns"])
+
+
+def format_lab_rows(rows: List[Dict[str, object]]) -> str:
+    """One line per result: test, value and unit, reference range, flag, panel and date."""
+    lines = []
+    for row in rows:
+        value = f"{row['value']} {row['unit']}".strip()
+        flag = {"H": " [HIGH]", "L": " [LOW]"}.get(row["flag"], f" [{row['flag']}]" if row["flag"] else "")
+        reference = f" (reference {row['range']})" if row["range"] else ""
+        panel = f"{row['panel_title']}, {row['date']}" if row["date"] else row["panel_title"]
+        lines.append(f"{row['test']}: {value}{reference}{flag} | {panel}")
+    return "\n".join(lines)
+
+
+def load_lab_store(patient_id: str, file_checksums: Optional[Dict[str, str]] = None) -> LabStore:
+    """Load the persisted lab store for a patient, rebuilding it when their lab files changed."""
+    if file_checksums is None:
+        file_checksums = generate_file_checksums(patient_id)
+    lab_checksums = {path: sha256 for path, sha256 in file_checksums.items() if source_category(path) == "labs"}
+    checksum = generate_patient_data_checksum(patient_id, lab_checksums)
+
+    path = os.path.join(PERSIST_DIRECTORY, "labs", f"patient_{patient_id}.json")
+    store = LabStore.load(path, checksum)
+    if store is None:
+        print("🔄 Building lab results store...")
+        rows = []
+        for file_path in sorted(lab_checksums):
+            with open(file_path, "r", encoding="utf-8") as f:
+                rows.extend(parse_lab_file(file_path, f.read()))
+        store = LabStore.from_rows(rows)
+        store.save(path, checksum)
+    return store
+
+
+# Least recently used first; the oldest stores are dropped past LAB_STORE_CONFIG["max_patients"]
+_stores: "OrderedDict[str, LabStore]" = OrderedDict()
+_loading: Dict[str, Future] = {}
+_stores_lock = threading.Lock()
+
+
+def get_lab_store(patient_id: str) -> LabStore:
+    """Return the in-memory lab store for a patient, loading it on first use.
+
+    The lock only guards the LRU itself. Concurrent first lookups for a patient wait on a
+    single load, and lookups for other patients are never blocked by it.
+    """
+    with _stores_lock:
+        store = _stores.get(patient_id)
+        if store is not None:
+            _stores.move_to_end(patient_id)
+            return store
+        future = _loading.get(patient_id)
+        is_loader = future is None
+        if is_loader:
+            future = _loading[patient_id] = Future()
+
+    if not is_loader:
+        return future.result()
+
+    try:
+        store = load_lab_store(patient_id)
+    except Exception as e:
+        with _stores_lock:
+            del _loading[patient_id]
+        future.set_exception(e)
+        raise
+
+    with _stores_lock:
+        _stores[patient_id] = store
+        del _loading[patient_id]
+        while len(_stores) > LAB_STORE_CONFIG["max_patients"]:
+            _stores.popitem(last=False)
+    future.set_result(store)
+    return store
+
+
+class LabLookupInput(BaseModel):
+    """Input to the lab lookup tool. The state is injected by the graph, not the model."""
+
+    analyte: Optional[str] = Field(default=None, description="lab test to look up, e.g. TSH, LDL, A1C, vitamin D")
+    flag: Optional[str] = Field(default=None, description="'high', 'low' or 'abnormal' to find out-of-range results")
+    panel: Optional[str] = Field(default=None, description="lab panel, e.g. thyroid, lipid, cbc, cmp, a1c")
+    state: Annotated[dict, InjectedState]
+
+
+def create_lab_lookup_tool(name: str, description: str, default_patient_id: str) -> StructuredTool:
+    """Create a tool that looks up the current patient's lab results in their lab store.
+
+    Matching rows are returned as the tool message artifact.
+    """
+    def lookup(state: dict, analyte: Optional[str] = None, flag: Optional[str] = None,
+               panel: Optional[str] = None) -> Tuple[str, List[Dict[str, object]]]:
+        patient_id = state.get("patient_id") or default_patient_id
+        validate_patient_id(patient_id)
+        rows = get_lab_store(patient_id).lookup(analyte=analyte, flag=flag, panel=panel)
+        tracing.annotate(lab_rows=len(rows))
+        if not rows:
+            return "No matching lab results found.", []
+        return format_lab_rows(rows), rows
+
+    return StructuredTool.from_function(
+        func=lookup,
+        name=name,
+        description=description,
+        args_schema=LabLookupInput,
+        response_format="content_and_artifact",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a patient's parsed lab results")
+    parser.add_argument("patient_id", nargs="?", default="drapoel")
+    parser.add_argument("--analyte", default=None)
+    parser.add_argument("--flag", default=None)
+    parser.add_argument("--panel", default=None)
+    args = parser.parse_args()
+
+    store = load_lab_store(args.patient_id)
+    rows = store.lookup(analyte=args.analyte, flag=args.flag, panel=args.panel)
+    print(format_lab_rows(rows))
+    print(f"\n🧪 {len(rows)} of {len(store)} lab results")
+
+
+if __name__ == "__main__":
+    main()
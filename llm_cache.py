@@ -0,0 +1,135 @@
+"""
+LLM Response Cache for Medical RAG System
+Content-addressed cache for every chat model call, with record and replay modes.
+
+Entries are keyed by LangChain's llm_string (model name and parameters, including bound
+tools) plus the full serialized message payload, minus per-run message IDs. Modes:
+- record: serve hits from the cache and store every new response
+- replay: serve hits from the cache and fail on any miss, so runs are fully offline
+- passthrough: no caching at all
+"""
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import config
+
+LLM_CACHE_MODES = ("record", "replay", "passthrough")
+
+LLM_CACHE_CONFIG = {
+    "mode": config.LLM_CACHE_MODE,
+    "path": "./cache/llm.sqlite",
+}
+
+
+def _strip_message_ids(value: Any) -> Any:
+    """Remove per-run message IDs from a serialized payload, keeping everything else."""
+    if isinstance(value, dict):
+        stripped = {key: _strip_message_ids(item) for key, item in value.items()}
+        if isinstance(stripped.get("kwargs"), dict):
+            stripped["kwargs"].pop("id", None)
+        return stripped
+    if isinstance(value, list):
+        return [_strip_message_ids(item) for item in value]
+    return value
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Serialized messages without the random IDs that LangGraph assigns on every run."""
+    try:
+        payload = json.loads(prompt)
+    except ValueError:
+        return prompt
+    return json.dumps(_strip_message_ids(payload), sort_keys=True)
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode when a call has no recorded response."""
+
+
+class ReplayableLLMCache(BaseCache):
+    """SQLite-backed LangChain cache that can record responses or replay them strictly."""
+
+    def __init__(self, path: str, mode: str = "record"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unsupported LLM cache mode for ReplayableLLMCache: {mode}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, llm_string TEXT NOT NULL, response TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{_normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ?", (self._key(prompt, llm_string),)
+            ).fetchone()
+            if row is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if row is not None:
+            return [loads(generation) for generation in loads(row[0])]
+        if self.mode == "replay":
+            raise LLMCacheMiss("No recorded LLM response for this call (replay mode). Re-run in record mode first.")
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode != "record":
+            return
+        response = dumps([dumps(generation) for generation in return_val])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, llm_string, response) VALUES (?, ?, ?)",
+                (self._key(prompt, llm_string), llm_string, response),
+            )
+            self._conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit and miss counters for this process."""
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def install_llm_cache(mode: Optional[str] = None, path: Optional[str] = None) -> Optional[ReplayableLLMCache]:
+    """Install the global LangChain LLM cache for every chat model in the process.
+
+    Returns the installed cache, or None in passthrough mode.
+    """
+    mode = mode or LLM_CACHE_CONFIG["mode"]
+    if mode not in LLM_CACHE_MODES:
+        raise ValueError(f"Unknown LLM cache mode: {mode}. Expected one of {', '.join(LLM_CACHE_MODES)}")
+
+    if mode == "passthrough":
+        set_llm_cache(None)
+        return None
+
+    cache = ReplayableLLMCache(path or LLM_CACHE_CONFIG["path"], mode=mode)
+    set_llm_cache(cache)
+    print(f"🗄️  LLM cache: {mode} ({cache.path})")
+    return cache
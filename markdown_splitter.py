@@ -0,0 +1,221 @@
+"""
+Markdown Splitter for Medical RAG System
+Structure-aware chunking for the patient markdown files, with no overlap.
+
+Files are split into sections at headings and `---` separators, and sections into
+blocks: paragraphs and lists, whole pipe tables, and single chat turns. Blocks are never
+split, so a lab table always stays in one chunk with its heading. Small neighbouring
+sections are packed together up to the size limit. Each chunk records its section path
+and the source category (labs, imaging, genetics, intake, medications or chat).
+
+Compare chunk and token counts with the current splitter:
+    python markdown_splitter.py compare drapoel
+"""
+
+from langchain_core.documents import Document
+from typing import Iterable, List, Optional, Tuple
+import argparse
+import os
+import re
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*$")
+SEPARATOR_PATTERN = re.compile(r"^\s*(-{3,}|\*{3,}|_{3,})\s*$")
+CHAT_TURN_PATTERN = re.compile(r"^\*\*[^*]+\*\*\s*\([^)]*\):")
+
+
+def source_category(source: str) -> str:
+    """Category of a patient file from its path: the folder under the patient, or the file name."""
+    parts = os.path.normpath(source).split(os.sep)
+    if "data" in parts:
+        parts = parts[parts.index("data") + 2:]
+    else:
+        parts = parts[-2:]
+    if len(parts) > 1:
+        return parts[0]
+    return os.path.splitext(parts[-1])[0]
+
+
+def source_subtype(source: str) -> str:
+    """Sub-type of a patient file, such as labs/thyroid, or just the category for top-level files."""
+    category = source_category(source)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return category if stem == category else f"{category}/{stem}"
+
+
+class Section:
+    """A run of blocks under one heading path."""
+
+    def __init__(self, headings: List[Tuple[int, str]]):
+        self.headings = list(headings)
+        self.blocks: List[str] = []
+
+    @property
+    def path(self) -> str:
+        return " > ".join(title for _, title in self.headings)
+
+    @property
+    def heading_text(self) -> str:
+        return "\n".join(f"{'#' * level} {title}" for level, title in self.headings)
+
+
+def parse_sections(text: str) -> List[Section]:
+    """Split markdown into sections of unsplittable blocks."""
+    sections: List[Section] = []
+    headings: List[Tuple[int, str]] = []
+    section = Section(headings)
+    block: List[str] = []
+    in_table = False
+
+    def flush_block():
+        nonlocal block, in_table
+        if block:
+            section.blocks.append("\n".join(line.rstrip() for line in block))
+        block, in_table = [], False
+
+    def flush_section():
+        nonlocal section
+        flush_block()
+        if section.blocks:
+            sections.append(section)
+        section = Section(headings)
+
+    for line in text.splitlines():
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            flush_section()
+            level = len(heading.group(1))
+            headings[:] = [entry for entry in headings if entry[0] < level] + [(level, heading.group(2))]
+            section = Section(headings)
+        elif SEPARATOR_PATTERN.match(line):
+            flush_section()
+        elif not line.strip():
+            if not in_table:
+                flush_block()
+        elif line.lstrip().startswith("|"):
+            if not in_table:
+                flush_block()
+                in_table = True
+            block.append(line)
+        elif CHAT_TURN_PATTERN.match(line):
+            flush_block()
+            block.append(line)
+        else:
+            if in_table:
+                flush_block()
+            block.append(line)
+
+    flush_section()
+    return sections
+
+
+class MarkdownSplitter:
+    """Packs whole sections, or whole blocks of larger sections, into chunks of up to max_chunk_chars."""
+
+    def __init__(self, max_chunk_chars: int = 1200):
+        self.max_chunk_chars = max_chunk_chars
+
+    def split_text(self, text: str) -> List[Tuple[str, str]]:
+        """Split text into (chunk text, section path) pairs."""
+        chunks: List[Tuple[str, str]] = []
+        parts: List[str] = []
+        paths: List[str] = []
+
+        def flush():
+            nonlocal parts, paths
+            if parts:
+                chunks.append(("\n\n".join(parts), " | ".join(dict.fromkeys(path for path in paths if path))))
+            parts, paths = [], []
+
+        def size():
+            return sum(len(part) + 2 for part in parts)
+
+        for section in parse_sections(text):
+            heading = section.heading_text
+            whole = "\n\n".join(([heading] if heading else []) + section.blocks)
+
+            if size() + len(whole) <= self.max_chunk_chars:
+                parts.append(whole)
+                paths.append(section.path)
+                continue
+
+            flush()
+            if len(whole) <= self.max_chunk_chars:
+                parts, paths = [whole], [section.path]
+                continue
+
+            # Too large for one chunk: split between blocks, repeating the heading for context
+            for block in section.blocks:
+                if parts and size() + len(block) > self.max_chunk_chars:
+                    flush()
+                if not parts and heading:
+                    parts.append(heading)
+                parts.append(block)
+                paths.append(section.path)
+            flush()
+
+        flush()
+        return chunks
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """Split loaded files into chunks carrying section_path and category metadata."""
+        chunks = []
+        for doc in documents:
+            category = source_category(doc.metadata.get("source", ""))
+            for text, section_path in self.split_text(doc.page_content):
+                metadata = dict(doc.metadata)
+                metadata["section_path"] = section_path
+                metadata["category"] = category
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
+
+
+def _tables(text: str) -> List[str]:
+    """Every pipe table in a text, as written."""
+    return [block for section in parse_sections(text) for block in section.blocks
+            if block.lstrip().startswith("|")]
+
+
+def compare_splitters(patient_id: str, max_chunk_chars: Optional[int] = None):
+    """Print chunk, character and token counts of the recursive and markdown splitters for a patient."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from retriever import generate_file_checksums, read_document, CHUNKING_CONFIG
+    from token_counter import count_tokens
+
+    documents = [doc for path, source_hash in sorted(generate_file_checksums(patient_id).items())
+                 for doc in read_document(path, source_hash)]
+    tables = [table for doc in documents for table in _tables(doc.page_content)]
+
+    splitters = {
+        "recursive": RecursiveCharacterTextSplitter(
+            chunk_size=CHUNKING_CONFIG["chunk_size"],
+            chunk_overlap=CHUNKING_CONFIG["chunk_overlap"],
+            separators=["\n---\n", "\n# ", "\n## ", "\n"],
+        ),
+        "markdown": MarkdownSplitter(max_chunk_chars or CHUNKING_CONFIG["max_chunk_chars"]),
+    }
+
+    source_tokens = sum(count_tokens(doc.page_content) for doc in documents)
+    print(f"📄 {patient_id}: {len(documents)} files | {source_tokens} tokens | {len(tables)} tables")
+    print(f"{'splitter':<12}{'chunks':>8}{'tokens':>9}{'vs source':>11}{'avg tok':>9}{'max tok':>9}{'split tables':>14}")
+    for name, splitter in splitters.items():
+        chunks = splitter.split_documents(documents)
+        tokens = [count_tokens(chunk.page_content) for chunk in chunks]
+        split_tables = sum(not any(table in chunk.page_content for chunk in chunks) for table in tables)
+        print(f"{name:<12}{len(chunks):>8}{sum(tokens):>9}{sum(tokens) / source_tokens:>10.0%} "
+              f"{sum(tokens) / len(tokens):>8.0f}{max(tokens):>9}{split_tables:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markdown splitter for patient data")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    compare = subcommands.add_parser("compare", help="Compare chunk and token counts with the recursive splitter")
+    compare.add_argument("patient_id", nargs="?", default="drapoel")
+    compare.add_argument("--max-chunk-chars", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare_splitters(args.patient_id, args.max_chunk_chars)
+
+
+if __name__ == "__main__":
+    main()
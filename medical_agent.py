@@ -1,69 +1,121 @@
-from retriever import create_retriever
-from grader import grade_documents
+from retriever_pool import RetrieverPool, create_patient_retriever_tool, DEFAULT_PATIENT_ID
+from lab_store import create_lab_lookup_tool, LAB_TOOL_NAME
+from grader import grade_documents, route_graded, get_gate_stats
 from rewriter import rewrite_question
-from compress import compress_context
+from compress import compress_context, COMPRESS_CONFIG, COMPRESS_MODES
 from generate_answer import generate_answer
-from judge_answer_split import judge_answer
+from judge_answer_split import judge_answer, JudgeWorker
 from custom_state import MedicalRAGState
 from golden_data_loader import load_golden_questions_raw
+from rerank_cache import get_rerank_cache
+from llm_cache import install_llm_cache, LLM_CACHE_MODES
+from tracing import WorkflowTracer, print_summary
+from results_store import ResultsStore
+from budget import BUDGET_CONFIG, new_budget, budget_exhausted, latest_context, report_exhausted, usage_tokens
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
 from langgraph.prebuilt import tools_condition
-from langchain.chat_models import init_chat_model
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
 
 import config
-import json
 import os
 import argparse
-from datetime import datetime
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from langchain.tools.retriever import create_retriever_tool
 
+JUDGE_MODES = ("inline", "background", "off")
 
-def create_workflow(use_reranker=True):
+
+def create_workflow(use_reranker=True, judge_mode="inline", tracer=None, pool=None):
     """Create a fresh workflow instance.
     
     Args:
         use_reranker: If True, use reranked retriever. If False, use base retriever only.
+        judge_mode: "inline" runs the judges as the last graph node. "background" and "off"
+            end the graph at generate_answer, leaving judging to the caller.
+        tracer: Optional WorkflowTracer that records a span for every node execution.
+        pool: Optional RetrieverPool to share between workflows. The patient searched is
+            taken from the state's patient_id, so one compiled graph serves every patient.
     """
-    llm_model = init_chat_model("openai:gpt-4o", temperature=0)
-    retriever = create_retriever("drapoel", use_reranker=use_reranker)
+    llm_model = config.get_chat_model()
+    pool = pool or RetrieverPool(use_reranker=use_reranker)
 
-    retriever_tool = create_retriever_tool(
-        retriever,
+    # Documents are kept as the tool message artifact so the grader can read their rerank scores
+    retriever_tool = create_patient_retriever_tool(
+        pool,
         "retrieve_patient_health_data",
-        "Search the current patient's health records using Semantic Search (RAG) and return relevant information. Always use this tool when asked about patient data - no patient ID needed."
+        "Search the current patient's health records using Semantic Search (RAG) and return relevant information. Always use this tool when asked about patient data - no patient ID needed.",
+    )
+    lab_tool = create_lab_lookup_tool(
+        LAB_TOOL_NAME,
+        "Look up the current patient's lab results by analyte (e.g. TSH, LDL, A1C), flag (high, low or abnormal) or panel (e.g. lipid, thyroid, cbc). Returns exact values with units, reference ranges and flags. Use this tool for questions about lab values or abnormal results, and retrieve_patient_health_data for everything else - no patient ID needed.",
+        DEFAULT_PATIENT_ID,
     )
+    tools = [retriever_tool, lab_tool]
 
     def run_retrieval_or_respond(state: MedicalRAGState):
         """Decide whether to retrieve documents or respond directly based on the question."""
-        response = llm_model.bind_tools([retriever_tool]).invoke(state["messages"])
-        return {"messages": [response]}
+        reason = budget_exhausted(state)
+        if reason and latest_context(state["messages"]) is not None:
+            report_exhausted("run_retrieval_or_respond", reason)
+            return {}
+        
+        # One tool call per turn, so the grader always judges a single tool result
+        response = llm_model.bind_tools(tools, parallel_tool_calls=False).invoke(state["messages"])
+        return {"messages": [response], "tokens_used": usage_tokens(response)}
+
+    def route_retrieval_or_respond(state: MedicalRAGState):
+        """Retrieve on a tool call. Once over budget, answer from the context retrieved so far."""
+        route = tools_condition(state)
+        # A direct answer is final, over budget or not
+        if route != "tools" and isinstance(state["messages"][-1], AIMessage):
+            return route
+        reason = budget_exhausted(state)
+        if reason and latest_context(state["messages"]) is not None:
+            if route == "tools":
+                report_exhausted("route_retrieval_or_respond", reason)
+            return "generate_answer"
+        return route
+
+    tool_node = ToolNode(tools)
+
+    def retrieve(state: MedicalRAGState, config: RunnableConfig):
+        """Run the retriever tool as a plain function so it can be traced like the other nodes."""
+        return tool_node.invoke(state, config)
+
+    def node(name, fn):
+        return tracer.wrap(name, fn) if tracer else fn
 
     workflow = StateGraph(MedicalRAGState)
 
-    workflow.add_node(run_retrieval_or_respond)
-    workflow.add_node("retrieve", ToolNode([retriever_tool])) 
-    workflow.add_node(compress_context)
-    workflow.add_node(rewrite_question)
-    workflow.add_node(generate_answer)
-    workflow.add_node(judge_answer)
+    workflow.add_node("run_retrieval_or_respond", node("run_retrieval_or_respond", run_retrieval_or_respond))
+    workflow.add_node("retrieve", node("retrieve", retrieve) if tracer else tool_node)
+    workflow.add_node("grade_documents", node("grade_documents", grade_documents))
+    workflow.add_node("compress_context", node("compress_context", compress_context))
+    workflow.add_node("rewrite_question", node("rewrite_question", rewrite_question))
+    workflow.add_node("generate_answer", node("generate_answer", generate_answer))
+    if judge_mode == "inline":
+        workflow.add_node("judge_answer", node("judge_answer", judge_answer))
 
     workflow.add_edge(START, "run_retrieval_or_respond")
 
     workflow.add_conditional_edges(
         "run_retrieval_or_respond",
-        tools_condition,
+        route_retrieval_or_respond,
         {
             "tools": "retrieve",
+            "generate_answer": "generate_answer",
             END: END,
         },
     )
 
+    workflow.add_edge("retrieve", "grade_documents")
     workflow.add_conditional_edges(
-        "retrieve",
-        grade_documents,
+        "grade_documents",
+        route_graded,
         {
             1: "compress_context",
             0: "rewrite_question",
@@ -71,28 +123,42 @@ def create_workflow(use_reranker=True):
     )
 
     workflow.add_edge("compress_context", "generate_answer")
-    workflow.add_edge("generate_answer", "judge_answer")
-    workflow.add_edge("judge_answer", END)
+    if judge_mode == "inline":
+        workflow.add_edge("generate_answer", "judge_answer")
+        workflow.add_edge("judge_answer", END)
+    else:
+        workflow.add_edge("generate_answer", END)
     workflow.add_edge("rewrite_question", "run_retrieval_or_respond")
 
-    return workflow.compile()
+    graph = workflow.compile()
+    # Registered as a callback so token usage from every model call lands on its node's span
+    return graph.with_config(callbacks=[tracer]) if tracer else graph
 
 
-def run_single_question(question_data: dict, use_reranker=True):
+def run_single_question(question_data: dict, use_reranker=True, graph=None, verbose=True, judge_worker=None):
     """Run a single question through the workflow with fresh state.
     
     Args:
         question_data: Dictionary containing question data
         use_reranker: If True, use reranked retriever. If False, use base retriever only.
+        graph: Optional pre-compiled workflow to reuse. A fresh one is created if omitted.
+        verbose: If True, print every node update as it arrives.
+        judge_worker: Optional JudgeWorker that judges the final state in the background.
+    
+    Returns:
+        Dictionary with the question data, system answer, judge feedback and timings. With a
+        judge_worker, judge_feedback is a future that resolves to the feedback text.
     """
-    print(f"\n{'='*80}")
-    print(f"🔍 Question ID: {question_data['id']}")
-    print(f"📝 Question: {question_data['text']}")
-    print(f"🔧 Reranker: {'Enabled' if use_reranker else 'Disabled'}")
-    print(f"{'='*80}")
+    if verbose:
+        print(f"\n{'='*80}")
+        print(f"🔍 Question ID: {question_data['id']}")
+        print(f"📝 Question: {question_data['text']}")
+        print(f"🔧 Reranker: {'Enabled' if use_reranker else 'Disabled'}")
+        print(f"{'='*80}")
     
-    # Create fresh workflow instance
-    graph = create_workflow(use_reranker=use_reranker)
+    # Create fresh workflow instance unless a compiled one is shared
+    if graph is None:
+        graph = create_workflow(use_reranker=use_reranker)
     
     # Create input state
     input_state = {
@@ -103,22 +169,61 @@ def run_single_question(question_data: dict, use_reranker=True):
             }
         ],
         "question_id": question_data["id"],
+        "patient_id": question_data.get("patient_id", DEFAULT_PATIENT_ID),
         "original_question": question_data["text"],
+        "budget": new_budget(),
+        "rewrite_count": 0,
+        "tokens_used": 0,
     }
     
     # Variables to capture results
     system_answer = None
     judge_feedback = None
     
+    final_state = None
+    
+    # Timing of the answer stream, relative to the start of the question
+    start_time = time.perf_counter()
+    last_update_time = start_time
+    generation_start = None
+    first_token_time = None
+    generation_end = None
+    
     step_count = 0
-    # Run the workflow
-    for chunk in graph.stream(input_state):
+    # Run the workflow, also receiving the full state after each step and answer tokens as they arrive
+    for mode, chunk in graph.stream(input_state, stream_mode=["updates", "values", "messages"]):
+        if mode == "values":
+            final_state = chunk
+            continue
+        
+        if mode == "messages":
+            message_chunk, metadata = chunk
+            if metadata.get("langgraph_node") != "generate_answer" or not message_chunk.content:
+                continue
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+                generation_start = last_update_time
+                if verbose:
+                    print(f"\n💬 Answer (first token after {first_token_time - start_time:.2f}s):")
+            if verbose:
+                print(message_chunk.content, end="", flush=True)
+            continue
+        
+        last_update_time = time.perf_counter()
         for node, update in chunk.items():
             step_count += 1
-            print(f"\n🔄 Step {step_count}: Update from node '{node}'")
-            if "messages" in update and update["messages"]:
+            if node == "generate_answer":
+                generation_end = last_update_time
+                if verbose and first_token_time is not None:
+                    print()
+            if verbose:
+                print(f"\n🔄 Step {step_count}: Update from node '{node}'")
+            # Nodes that change nothing, like compress_context on lab results, stream a None update
+            if update and update.get("messages"):
                 try:
-                    update["messages"][-1].pretty_print()
+                    # The answer was already printed token by token
+                    if verbose and not (node == "generate_answer" and first_token_time is not None):
+                        update["messages"][-1].pretty_print()
                     
                     # Capture system answer from generate_answer node
                     if node == "generate_answer":
@@ -130,24 +235,87 @@ def run_single_question(question_data: dict, use_reranker=True):
                         
                 except Exception as e:
                     print(f"Content: {update['messages'][-1].content}")
-            print("-" * 40)
+            if verbose:
+                print("-" * 40)
+    
+    # Hand the finished answer to the background judges instead of waiting for them
+    if judge_worker is not None and final_state is not None and system_answer is not None:
+        judge_feedback = judge_worker.submit(final_state)
     
-    # Save results to file
-    save_results(question_data, system_answer, judge_feedback)
+    timings = {
+        "time_to_first_token": first_token_time - start_time if first_token_time else None,
+        "generation_time": generation_end - generation_start if generation_start and generation_end else None,
+        "total_time": time.perf_counter() - start_time,
+    }
     
-    print(f"✅ Completed question: {question_data['id']}")
-    return True
+    print(f"✅ Completed question: {question_data['id']} | {format_timings(timings)}")
+    return {
+        "question_data": question_data,
+        "system_answer": system_answer,
+        "judge_feedback": judge_feedback,
+        "timings": timings,
+    }
 
 
-def save_results(question_data: dict, system_answer: str, judge_feedback: str):
-    """Save question, system answer, and complete judge feedback to results.txt"""
-    with open("results.txt", "a", encoding="utf-8") as f:
-        f.write(f"{'='*80}\n")
-        f.write(f"QUESTION ID: {question_data['id']}\n")
-        f.write(f"QUESTION: {question_data['text']}\n")
-        f.write(f"\nSYSTEM ANSWER:\n{system_answer or 'No answer captured'}\n")
-        f.write(f"\nJUDGE EVALUATION:\n{judge_feedback or 'No feedback captured'}\n")
-        f.write(f"{'='*80}\n\n")
+def format_timings(timings: dict) -> str:
+    """One-line summary of per-question timings."""
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "n/a"
+    
+    return (f"⏱️  Time to first token: {seconds(timings['time_to_first_token'])} | "
+            f"Generation: {seconds(timings['generation_time'])} | "
+            f"Total: {seconds(timings['total_time'])}")
+
+
+def run_questions(golden_questions: dict, use_reranker=True, concurrency=1, judge_mode="inline", tracer=None):
+    """Run golden questions through one compiled workflow.
+    
+    The workflow (LLM client, retriever and compiled graph) is built once and
+    shared. Questions are pushed through a bounded thread pool, since each one
+    spends nearly all of its time waiting on the network.
+    
+    Args:
+        golden_questions: Mapping of question ID to question data
+        use_reranker: If True, use reranked retriever. If False, use base retriever only.
+        concurrency: Maximum number of questions in flight at once.
+        judge_mode: "inline", "background" (judged by a JudgeWorker while later questions run) or "off".
+        tracer: Optional WorkflowTracer that records per-node spans.
+    
+    Returns:
+        List of per-question results in the same order as golden_questions.
+        Failed questions are returned as None.
+    """
+    graph = create_workflow(use_reranker=use_reranker, judge_mode=judge_mode, tracer=tracer)
+    judge_worker = JudgeWorker(max_workers=max(2, concurrency)) if judge_mode == "background" else None
+    questions = list(golden_questions.values())
+    verbose = concurrency == 1
+    
+    def run(question_data):
+        try:
+            return run_single_question(question_data, use_reranker=use_reranker, graph=graph,
+                                       verbose=verbose, judge_worker=judge_worker)
+        except Exception as e:
+            print(f"❌ Error processing question {question_data['id']}: {str(e)}")
+            return None
+    
+    if concurrency == 1:
+        results = [run(question_data) for question_data in questions]
+    else:
+        # executor.map yields results in submission order, keeping output deterministic
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(run, questions))
+    
+    if judge_worker is not None:
+        # Wait for the background judges before results are saved
+        for result in results:
+            if result is not None and isinstance(result["judge_feedback"], Future):
+                try:
+                    result["judge_feedback"] = result["judge_feedback"].result()
+                except Exception as e:
+                    result["judge_feedback"] = f"Judging failed: {str(e)}"
+        judge_worker.close()
+    
+    return results
 
 
 def main():
@@ -156,33 +324,73 @@ def main():
     parser = argparse.ArgumentParser(description='Medical RAG Agent')
     parser.add_argument('--no-reranker', action='store_true', 
                        help='Disable reranker and use base retriever only')
+    parser.add_argument('--concurrency', type=int, default=1,
+                       help='Number of questions to run in parallel (default: 1)')
+    parser.add_argument('--judge-mode', choices=JUDGE_MODES, default='inline',
+                       help='Run judges inline as a graph node, in a background worker queue, or not at all')
+    parser.add_argument('--llm-cache', choices=LLM_CACHE_MODES, default=config.LLM_CACHE_MODE,
+                       help='LLM response cache: record, replay (offline, fail on miss) or passthrough')
+    parser.add_argument('--trace', default='traces.jsonl', metavar='PATH',
+                       help="Write per-node spans as JSONL (default: traces.jsonl, '' to keep them in memory only)")
+    parser.add_argument('--results', default=None, metavar='PATH',
+                       help='Results JSONL file (default: results/<timestamp>.jsonl)')
+    parser.add_argument('--compress-mode', choices=COMPRESS_MODES, default=COMPRESS_CONFIG["mode"],
+                       help='Context compression: extractive (local, verbatim), llm_ids (LLM picks chunks) or llm (LLM rewrite)')
+    parser.add_argument('--max-rewrites', type=int, default=BUDGET_CONFIG["max_rewrites"],
+                       help='Question rewrites before answering with the best context found')
+    parser.add_argument('--max-seconds', type=float, default=BUDGET_CONFIG["max_seconds"],
+                       help='Wall-clock budget per question')
+    parser.add_argument('--max-tokens', type=int, default=BUDGET_CONFIG["max_tokens"],
+                       help='Model token budget per question')
     args = parser.parse_args()
     
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    COMPRESS_CONFIG["mode"] = args.compress_mode
+    BUDGET_CONFIG.update(max_rewrites=args.max_rewrites, max_seconds=args.max_seconds, max_tokens=args.max_tokens)
+    
     use_reranker = not args.no_reranker
     
     try:
-        # Clear results file at start
-        with open("results.txt", "w", encoding="utf-8") as f:
-            f.write(f"MEDICAL RAG EVALUATION RESULTS\n")
-            f.write(f"Generated on: {json.dumps(str(datetime.now()))}\n")
-            f.write(f"Reranker: {'Enabled' if use_reranker else 'Disabled'}\n")
-            f.write(f"{'='*80}\n\n")
+        llm_cache = install_llm_cache(args.llm_cache)
+        # Spans are always collected, since each result record carries its per-node latency
+        tracer = WorkflowTracer(args.trace or None)
+        results_store = ResultsStore(args.results, use_reranker=use_reranker)
         
         # Load golden questions
         golden_questions = load_golden_questions_raw("drapoel")
         print(f"📚 Loaded {len(golden_questions)} golden questions")
         print(f"🔧 Reranker: {'Enabled' if use_reranker else 'Disabled'}")
+        print(f"⚡ Concurrency: {args.concurrency}")
         
-        # Run each question with fresh state
-        for question_id, question_data in golden_questions.items():
-            try:
-                run_single_question(question_data, use_reranker=use_reranker)
-            except Exception as e:
-                print(f"❌ Error processing question {question_id}: {str(e)}")
-                continue
+        # Run all questions through one compiled workflow
+        results = run_questions(golden_questions, use_reranker=use_reranker,
+                                concurrency=args.concurrency, judge_mode=args.judge_mode, tracer=tracer)
+        
+        # Save results in question order, regardless of completion order
+        for result in results:
+            if result is not None:
+                results_store.add(result["question_data"], result["system_answer"], result["judge_feedback"],
+                                  result["timings"], tracer.spans_for(result["question_data"]["id"]))
+        results_store.flush()
+        tracer.close()
         
         print(f"\n🎉 Completed processing all {len(golden_questions)} questions!")
-        print(f"📄 Results saved to results.txt")
+        print(f"📄 Results saved to {results_store.path}")
+        
+        if args.trace:
+            print_summary(args.trace)
+        
+        if llm_cache is not None:
+            cache_stats = llm_cache.stats()
+            print(f"🗄️  LLM cache - Hits: {cache_stats['hits']} | Misses: {cache_stats['misses']}")
+        
+        gate_stats = get_gate_stats()
+        print(f"🚦 Grader - Score gate accepted: {gate_stats['accepted']} | rejected: {gate_stats['rejected']} | LLM graded: {gate_stats['llm']}")
+        
+        if use_reranker:
+            cache_stats = get_rerank_cache().stats()
+            print(f"♻️  Rerank cache - Hits: {cache_stats['hits']} (disk: {cache_stats['disk_hits']}) | Misses: {cache_stats['misses']}")
         
     except Exception as e:
         print(f"❌ Error in main execution: {str(e)}")
@@ -51,11 +51,11 @@ def test_medical_workflow():
             AIMessage(content=context)
         ]
     }
-    decision = grade_documents(grader_state)
+    decision = grade_documents(grader_state)["documents_relevant"]
     print(f"\n\n⚖️ Grader Decision: {decision}")
     
     # Step 4: Generate answer if documents are relevant
-    if decision == "generate_answer":
+    if decision == 1:
         answer_state = generate_answer(grader_state)
         medical_answer = answer_state["messages"][0].content
         print(f"\n\n🏥 Medical Answer: {medical_answer}")
@@ -82,14 +82,13 @@ def test_question_rewriting():
 
 def cosine_distance(sentence1: str, sentence2: str, print_result: bool = True) -> tuple[str, float]:
     """Calculate cosine similarity between two sentences using embeddings."""
-    from langchain_openai import OpenAIEmbeddings
+    from embedding_cache import get_embeddings
     from sklearn.metrics.pairwise import cosine_similarity
     import numpy as np
 
-    embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+    embedding_model = get_embeddings()
     
-    emb1 = embedding_model.embed_query(sentence1)
-    emb2 = embedding_model.embed_query(sentence2)
+    emb1, emb2 = embedding_model.embed_documents([sentence1, sentence2])
     
     # Reshape for sklearn
     emb1 = np.array(emb1).reshape(1, -1)
@@ -0,0 +1,297 @@
+"""
+NumPy Vector Store for Medical RAG System
+In-process vector index for small per-patient corpora, as an alternative to Chroma.
+
+Embeddings are kept L2-normalised as float32 in a memory-mapped `.npy` file next to a
+JSON chunk table, so cosine similarity for a query is a single matrix-vector product.
+Searches accept Chroma-style `where` metadata filters.
+"""
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import os
+import uuid
+
+import numpy as np
+
+from atomic_write import atomic_write
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise rows, leaving all-zero rows untouched."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores along the last axis, best first."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def matches_filter(metadata: dict, where: Optional[dict]) -> bool:
+    """Evaluate a Chroma-style `where` filter ($eq, $ne, $in, $nin, $and, $or) against chunk metadata."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                if operator == "$eq":
+                    ok = value == operand
+                elif operator == "$ne":
+                    ok = value != operand
+                elif operator == "$in":
+                    ok = value in operand
+                elif operator == "$nin":
+                    ok = value not in operand
+                else:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+                if not ok:
+                    return False
+    return True
+
+
+class NumpyVectorStore(VectorStore):
+    """Vector store backed by a memory-mapped matrix of normalised embeddings."""
+
+    def __init__(self, collection_name: str, embedding_function: Embeddings, persist_directory: str):
+        self.collection_name = collection_name
+        self._embedding_function = embedding_function
+        self._directory = os.path.join(persist_directory, "numpy", collection_name)
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Collection-level metadata, such as the patient data checksum."""
+        return self._collection_metadata
+
+    def modify(self, metadata: Dict[str, Any]):
+        """Replace the collection-level metadata."""
+        self._collection_metadata = dict(metadata)
+        self._save()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _paths(self) -> Tuple[str, str]:
+        return (
+            os.path.join(self._directory, "embeddings.npy"),
+            os.path.join(self._directory, "chunks.json"),
+        )
+
+    def _load(self):
+        """Load the chunk table and memory-map the embedding matrix, if they exist."""
+        embeddings_path, chunks_path = self._paths()
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._collection_metadata: Dict[str, Any] = {}
+        self._matrix: Optional[np.ndarray] = None
+
+        if not os.path.exists(chunks_path):
+            return
+
+        with open(chunks_path, 'r', encoding='utf-8') as f:
+            table = json.load(f)
+        self._ids = table["ids"]
+        self._texts = table["texts"]
+        self._metadatas = table["metadatas"]
+        self._collection_metadata = table.get("metadata", {})
+
+        if self._ids and os.path.exists(embeddings_path):
+            self._matrix = np.load(embeddings_path, mmap_mode="r")
+            # The two files are replaced one after the other, so concurrent writers can leave a mismatched pair
+            if self._matrix.shape[0] != len(self._ids):
+                raise ValueError(f"Collection {self.collection_name} has {self._matrix.shape[0]} embeddings "
+                                 f"for {len(self._ids)} chunks; delete {self._directory} to rebuild it")
+
+    def _save(self, matrix: Optional[np.ndarray] = None):
+        """Write the chunk table (and optionally a new matrix) atomically, then reload."""
+        embeddings_path, chunks_path = self._paths()
+
+        if matrix is not None:
+            with atomic_write(embeddings_path, 'wb') as f:
+                np.save(f, matrix)
+
+        table = {
+            "ids": self._ids,
+            "texts": self._texts,
+            "metadatas": self._metadatas,
+            "metadata": self._collection_metadata,
+        }
+        with atomic_write(chunks_path) as f:
+            json.dump(table, f)
+
+        self._load()
+
+    def _current_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.asarray(self._matrix)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Embed and add texts, replacing any existing chunks with the same IDs."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+
+        vectors = _normalise(np.asarray(self._embedding_function.embed_documents(texts), dtype=np.float32))
+
+        # Upsert semantics: drop existing rows with the same IDs first
+        new_ids = set(ids)
+        keep = [i for i, doc_id in enumerate(self._ids) if doc_id not in new_ids]
+        matrix = self._current_matrix()
+        matrix = np.concatenate([matrix[keep], vectors]) if len(keep) else vectors
+
+        self._ids = [self._ids[i] for i in keep] + ids
+        self._texts = [self._texts[i] for i in keep] + texts
+        self._metadatas = [self._metadatas[i] for i in keep] + [dict(m or {}) for m in metadatas]
+        self._save(matrix)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete chunks by ID."""
+        if not ids:
+            return False
+        removed = set(ids)
+        keep = [i for i, doc_id in enumerate(self._ids) if doc_id not in removed]
+        if len(keep) == len(self._ids):
+            return False
+
+        matrix = self._current_matrix()[keep] if keep else np.empty((0, 0), dtype=np.float32)
+        self._ids = [self._ids[i] for i in keep]
+        self._texts = [self._texts[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._save(matrix)
+        return True
+
+    def get(self, ids: Optional[List[str]] = None, include: Sequence[str] = ("metadatas", "documents")) -> Dict[str, list]:
+        """Return stored chunks in the same shape as Chroma's `get`."""
+        if ids is None:
+            indices = range(len(self._ids))
+        else:
+            wanted = set(ids)
+            indices = [i for i, doc_id in enumerate(self._ids) if doc_id in wanted]
+
+        result = {"ids": [self._ids[i] for i in indices]}
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadatas[i] for i in indices]
+        if "documents" in include:
+            result["documents"] = [self._texts[i] for i in indices]
+        return result
+
+    def _document(self, index: int) -> Document:
+        return Document(id=self._ids[index], page_content=self._texts[index], metadata=dict(self._metadatas[index]))
+
+    def _filter_mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """Boolean mask of the chunks matching a filter, or None to search every chunk."""
+        if not where:
+            return None
+        return np.fromiter((matches_filter(metadata, where) for metadata in self._metadatas),
+                           dtype=bool, count=len(self._metadatas))
+
+    def similarity_search_by_vectors_with_score(
+        self, embeddings: Sequence[Sequence[float]], k: int = 4, filter: Optional[dict] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Score many query embeddings against the index with a single matrix product."""
+        if self._matrix is None or not len(embeddings):
+            return [[] for _ in embeddings]
+
+        queries = _normalise(np.asarray(embeddings, dtype=np.float32))
+        scores = queries @ self._matrix.T
+        mask = self._filter_mask(filter)
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+            k = min(k, int(mask.sum()))
+        top = _top_k(scores, k)
+        return [
+            [(self._document(int(i)), float(row_scores[i])) for i in row_top]
+            for row_scores, row_top in zip(scores, top)
+        ]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vectors_with_score([embedding], k=k, filter=filter)[0]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=kwargs.get("filter"))]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Return documents with their cosine similarity to the query."""
+        return self.similarity_search_by_vector_with_score(
+            self._embedding_function.embed_query(query), k=k, filter=kwargs.get("filter"))
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def batch_similarity_search(self, queries: List[str], k: int = 4, filter: Optional[dict] = None) -> List[List[Document]]:
+        """Embed all queries in one request and score them in one matrix product."""
+        if not queries:
+            return []
+        embeddings = self._embedding_function.embed_documents(queries)
+        return [[doc for doc, _ in results]
+                for results in self.similarity_search_by_vectors_with_score(embeddings, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    def as_retriever(self, **kwargs: Any) -> "NumpyVectorStoreRetriever":
+        tags = kwargs.pop("tags", None) or []
+        tags.extend(self._get_retriever_tags())
+        return NumpyVectorStoreRetriever(vectorstore=self, tags=tags, **kwargs)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        collection_name: str = "default",
+        persist_directory: str = "./chroma_db",
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(collection_name=collection_name, embedding_function=embedding, persist_directory=persist_directory)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+class NumpyVectorStoreRetriever(VectorStoreRetriever):
+    """VectorStoreRetriever whose `batch` scores all queries in one matrix product."""
+
+    def batch(self, inputs: List[str], config=None, *, return_exceptions: bool = False, **kwargs: Any) -> List[List[Document]]:
+        if self.search_type != "similarity" or not inputs:
+            return super().batch(inputs, config, return_exceptions=return_exceptions, **kwargs)
+        k = self.search_kwargs.get("k", 4)
+        return self.vectorstore.batch_similarity_search(list(inputs), k=k, filter=self.search_kwargs.get("filter"))
@@ -0,0 +1,110 @@
+"""
+Query Router for Medical RAG System
+Restricts vector search to the data categories a query is about.
+
+Chunks are tagged at ingestion with the category of their file (intake, medications, labs,
+imaging, genetics or chat). A query is routed by keywords to the categories it mentions,
+and vector search runs with a Chroma `where` filter on those categories. Chat logs discuss
+every topic, so they are always searched. Queries that match no keywords, and filtered
+searches that come back with too few or weak results, fall back to the full search.
+"""
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from typing import Dict, List, Optional, Tuple
+import re
+
+import tracing
+
+ROUTER_CONFIG = {
+    "enabled": True,
+    "always_include": ["chat"],   # Categories searched for every routed query
+    "min_results": 5,             # Fewer filtered results than this falls back to the full search
+    "min_score": 0.3,             # As does a best cosine similarity below this
+}
+
+# Keyword patterns and the categories they route to
+ROUTES = [
+    (re.compile(r"\b(medications?|medicines?|meds|drugs?|prescri\w*|dos(e|es|age|ing)|pills?|supplements?|"
+                r"taking|levothyroxine|statins?|atorvastatin|aspirin|metformin)\b"), ["medications", "intake"]),
+    (re.compile(r"\b(labs?|laboratory|blood ?work|blood tests?|test results?|panels?|levels?|reference range|"
+                r"tsh|t3|t4|thyroid|a1c|hba1c|glucose|cholesterol|ldl|hdl|triglycerides?|lipids?|hs-?crp|crp|"
+                r"vitamin d|vit-?d|cbc|cmp|urinalysis|urine|hemoglobin|creatinine|alt|ast|sodium|potassium|"
+                r"wbc|platelets?)\b"), ["labs"]),
+    (re.compile(r"\b(imaging|scans?|body ?scan|mri|ct|x-?rays?|ultrasound|radiolog\w*|dexa|bone density|bmd|"
+                r"osteopenia|body composition|body fat)\b"), ["imaging"]),
+    (re.compile(r"\b(genes?|genetics?|genomic\w*|variants?|genotypes?|snps?|dna|rs\d+|apoe|mthfr|mutations?|"
+                r"hereditary|inherited)\b"), ["genetics"]),
+    (re.compile(r"\b(intake|allerg\w*|family history|medical history|history|surger\w*|demographics?|age|"
+                r"gender|ethnicity|occupation|lifestyle|smok\w*|alcohol|diet\w*|exercise|concerns?|symptoms?)\b"),
+     ["intake"]),
+]
+
+
+def route_query(query: str) -> Optional[List[str]]:
+    """Categories to search for a query, or None to search every chunk."""
+    text = query.lower()
+    categories: Dict[str, None] = {}
+    for pattern, targets in ROUTES:
+        if pattern.search(text):
+            categories.update(dict.fromkeys(targets))
+    if not categories:
+        return None
+    categories.update(dict.fromkeys(ROUTER_CONFIG["always_include"]))
+    return list(categories)
+
+
+def category_filter(categories: List[str]) -> dict:
+    """Chroma `where` filter restricting a search to chunks of the given categories."""
+    return {"category": {"$in": list(categories)}}
+
+
+class RoutedVectorRetriever(BaseRetriever):
+    """Vector retriever that searches only the categories a query is routed to, with fallback."""
+
+    vectorstore: VectorStore
+    k: int = 25
+    min_results: int = 5
+    min_score: float = 0.3
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _accept(self, categories: List[str], results: List[Tuple[Document, float]]) -> bool:
+        """Whether a filtered search is good enough to use, tracing the decision."""
+        accepted = len(results) >= self.min_results and results[0][1] >= self.min_score
+        tracing.annotate(route=",".join(categories), route_fallback=not accepted)
+        return accepted
+
+    def search(self, query: str) -> Tuple[List[Document], Optional[List[str]]]:
+        """Return the documents and the categories they were restricted to (None if unfiltered)."""
+        categories = route_query(query)
+        if categories is None:
+            tracing.annotate(route="all")
+        else:
+            results = self.vectorstore.similarity_search_with_relevance_scores(
+                query, k=self.k, filter=category_filter(categories))
+            if self._accept(categories, results):
+                return [doc for doc, _ in results], categories
+        return self.vectorstore.similarity_search(query, k=self.k), None
+
+    async def asearch(self, query: str) -> Tuple[List[Document], Optional[List[str]]]:
+        """Async version of search."""
+        categories = route_query(query)
+        if categories is None:
+            tracing.annotate(route="all")
+        else:
+            results = await self.vectorstore.asimilarity_search_with_relevance_scores(
+                query, k=self.k, filter=category_filter(categories))
+            if self._accept(categories, results):
+                return [doc for doc, _ in results], categories
+        return await self.vectorstore.asimilarity_search(query, k=self.k), None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.search(query)[0]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return (await self.asearch(query))[0]
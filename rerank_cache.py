@@ -0,0 +1,132 @@
+"""
+Rerank Cache for Medical RAG System
+LRU + TTL cache of reranking results, in memory with an optional SQLite tier on disk.
+
+Entries are keyed by the normalised query plus the ordered content hashes of the
+candidate chunks, and store the ranking as (candidate index, rerank score) pairs.
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RERANK_CACHE_CONFIG = {
+    "max_entries": 1024,               # In-memory LRU size
+    "ttl_seconds": 7 * 24 * 3600,      # Entries older than this are ignored
+    "disk_path": "./cache/rerank.sqlite",  # Set to None to keep the cache in memory only
+}
+
+Ranking = List[Tuple[int, float]]
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a query."""
+    return " ".join(query.lower().split())
+
+
+def rerank_cache_key(query: str, documents: Sequence[str], top_k: int, model: str) -> str:
+    """Cache key for reranking these candidate texts, in this order, for this query."""
+    hasher = hashlib.sha256()
+    hasher.update(f"{model}\0{top_k}\0{normalize_query(query)}\0".encode("utf-8"))
+    for text in documents:
+        hasher.update(hashlib.sha256(text.encode("utf-8")).digest())
+    return hasher.hexdigest()
+
+
+class RerankCache:
+    """Thread-safe LRU + TTL cache of rankings with an optional persistent tier."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 7 * 24 * 3600, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[str, Tuple[float, Ranking]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if disk_path:
+            if os.path.dirname(disk_path):
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rerank_cache ("
+                "key TEXT PRIMARY KEY, ranking TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Ranking]:
+        """Return the cached ranking for a key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, ranking = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return ranking
+                del self._entries[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT ranking, created_at FROM rerank_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl_seconds:
+                    ranking = [(int(index), float(score)) for index, score in json.loads(row[0])]
+                    self._remember(key, row[1], ranking)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return ranking
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, ranking: Ranking):
+        """Store a ranking in memory and, if enabled, on disk."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, ranking)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rerank_cache (key, ranking, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(ranking), now),
+                )
+                self._conn.execute("DELETE FROM rerank_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+                self._conn.commit()
+
+    def _remember(self, key: str, created_at: float, ranking: Ranking):
+        self._entries[key] = (created_at, ranking)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the in-memory size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+@lru_cache(maxsize=None)
+def get_rerank_cache() -> RerankCache:
+    """Return the process-wide rerank cache configured by RERANK_CACHE_CONFIG."""
+    return RerankCache(
+        max_entries=RERANK_CACHE_CONFIG["max_entries"],
+        ttl_seconds=RERANK_CACHE_CONFIG["ttl_seconds"],
+        disk_path=RERANK_CACHE_CONFIG["disk_path"],
+    )
@@ -2,84 +2,124 @@
 Reranked Retriever - A wrapper that adds Cohere reranking to any LangChain retriever.
 """
 
-from reranker import CohereReranker
-
-
-class RerankedRetriever:
-    """Simple wrapper that adds reranking to any retriever."""
-    
-    def __init__(self, base_retriever, top_k=5, verbose=True):
-        self.retriever = base_retriever
-        self.reranker = CohereReranker()
-        self.top_k = top_k
-        self.verbose = verbose
-    
-    def get_relevant_documents(self, query: str):
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+from reranker import CohereReranker, COHERE_METHOD
+from rerank_cache import rerank_cache_key
+from typing import Any, List, Optional, Tuple
+import tracing
+
+
+class RerankedRetriever(BaseRetriever):
+    """Retriever that adds reranking to any retriever, with sync and async paths."""
+
+    retriever: BaseRetriever
+    reranker: Any = Field(default_factory=CohereReranker)
+    top_k: int = 5
+    verbose: bool = True
+    cache: Any = None
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(self, base_retriever: Optional[BaseRetriever] = None, top_k: int = 5, verbose: bool = True, cache=None, **kwargs):
+        if base_retriever is not None:
+            kwargs["retriever"] = base_retriever
+        super().__init__(top_k=top_k, verbose=verbose, cache=cache, **kwargs)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
         """Get documents and rerank them."""
         # Get initial documents
-        initial_docs = self.retriever.invoke(query)
-        
+        initial_docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        unique_docs = self._prepare_candidates(initial_docs)
+        if not unique_docs:
+            return []
+
+        cache_key, ranking = self._cached_ranking(query, unique_docs)
+        if ranking is not None:
+            return self._apply_ranking(unique_docs, ranking)
+
+        results = self.reranker.rerank(query, [doc.page_content for doc in unique_docs], top_k=self.top_k)
+        return self._finish(unique_docs, results, cache_key)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        """Get documents and rerank them without blocking the event loop."""
+        initial_docs = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        unique_docs = self._prepare_candidates(initial_docs)
+        if not unique_docs:
+            return []
+
+        cache_key, ranking = self._cached_ranking(query, unique_docs)
+        if ranking is not None:
+            return self._apply_ranking(unique_docs, ranking)
+
+        results = await self.reranker.arerank(query, [doc.page_content for doc in unique_docs], top_k=self.top_k)
+        return self._finish(unique_docs, results, cache_key)
+
+    def _prepare_candidates(self, initial_docs: List[Document]) -> List[Document]:
         if self.verbose:
             print(f"🔍 Retrieved {len(initial_docs)} initial documents")
-        
+
         # Remove duplicates based on content
         unique_docs = self._deduplicate_documents(initial_docs)
-        
+        tracing.annotate(retrieved=len(initial_docs), deduplicated=len(unique_docs))
+
         if self.verbose:
             print(f"📝 Deduplicated to {len(unique_docs)} unique documents")
-        
-        if not unique_docs:
-            return []
-        
-        # Rerank documents
-        reranked_docs = self._rerank_documents(query, unique_docs)
-        
-        if self.verbose:
-            print(f"📊 Reranked to top {len(reranked_docs)} documents")
-        
-        return reranked_docs
-    
+
+        return unique_docs
+
     def _deduplicate_documents(self, docs):
         """Remove duplicate documents based on content hash."""
         unique_docs = []
         seen_hashes = set()
-        
+
         for doc in docs:
             content_hash = hash(doc.page_content[:200].strip())
             if content_hash not in seen_hashes:
                 unique_docs.append(doc)
                 seen_hashes.add(content_hash)
-        
+
         return unique_docs
-    
-    def _rerank_documents(self, query, docs):
-        """Rerank documents using Cohere."""
-        # Extract text for reranking
-        documents_text = [doc.page_content for doc in docs]
-        
-        # Get reranked results
-        reranked_results = self.reranker.rerank(query, documents_text, top_k=self.top_k)
-        
-        # Map back to original documents
+
+    def _cached_ranking(self, query: str, docs: List[Document]) -> Tuple[Optional[str], Optional[list]]:
+        """Look up a stored ranking for these candidates. Returns (cache key, ranking or None)."""
+        if self.cache is None:
+            return None, None
+
+        cache_key = rerank_cache_key(query, [doc.page_content for doc in docs], self.top_k, self.reranker.model)
+        ranking = self.cache.get(cache_key)
+        tracing.annotate(rerank_cache_hit=ranking is not None)
+        if ranking is not None and self.verbose:
+            print("♻️  Rerank cache hit")
+        return cache_key, ranking
+
+    def _finish(self, docs: List[Document], results: List[Tuple[int, float, str]], cache_key: Optional[str]) -> List[Document]:
+        """Apply fresh reranker results and cache real Cohere rankings."""
+        ranking = [(index, score) for index, score, _ in results]
+        method = results[0][2] if results else COHERE_METHOD
+
+        # Only cache real Cohere rankings, never local fallbacks
+        if cache_key is not None and method == COHERE_METHOD:
+            self.cache.put(cache_key, ranking)
+
+        return self._apply_ranking(docs, ranking, method)
+
+    def _apply_ranking(self, docs, ranking, method=COHERE_METHOD):
+        """Order documents by a ranking of (index, score) pairs and attach the scores."""
         reranked_docs = []
-        for text, score in reranked_results:
-            # Find matching document
-            for doc in docs:
-                if doc.page_content == text:
-                    # Add rerank score to metadata
-                    if not hasattr(doc, 'metadata'):
-                        doc.metadata = {}
-                    doc.metadata['rerank_score'] = score
-                    reranked_docs.append(doc)
-                    break
-        
+        for index, score in ranking:
+            doc = docs[index]
+            # Add rerank score and how it was produced to metadata
+            doc.metadata['rerank_score'] = score
+            doc.metadata['rerank_method'] = method
+            reranked_docs.append(doc)
+        tracing.annotate(reranked=len(reranked_docs), rerank_method=method)
+
+        if self.verbose:
+            print(f"📊 Reranked to top {len(reranked_docs)} documents")
+
         return reranked_docs
-    
-    def invoke(self, inputs, config=None):
-        """Compatibility method for LangChain integration."""
-        if isinstance(inputs, dict) and 'query' in inputs:
-            return self.get_relevant_documents(inputs['query'])
-        elif isinstance(inputs, str):
-            return self.get_relevant_documents(inputs)
-        else:
-            return self.get_relevant_documents(str(inputs))
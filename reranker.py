@@ -1,28 +1,175 @@
-import cohere
+import asyncio
+import math
 import os
+import threading
+import time
+from functools import lru_cache
 from typing import List, Tuple
 
+from bm25_index import score_texts
+
+RERANK_MODEL = "rerank-english-v3.0"  # Standard Cohere rerank model
+
+RERANKER_CONFIG = {
+    "timeout_seconds": 3,            # Per-call deadline for Cohere
+    "slow_call_seconds": 1.5,        # Calls slower than this count as failures for the breaker
+    "failure_threshold": 3,          # Consecutive failed or slow calls that open the breaker
+    "reset_timeout_seconds": 30.0,   # How long the breaker stays open before a trial call
+}
+
+# How a ranking was produced, recorded in each document's metadata
+COHERE_METHOD = "cohere"
+FALLBACK_METHOD = "bm25_fallback"
+
+
+class CircuitBreaker:
+    """Opens after repeated failed or slow calls so callers stop waiting on a degraded service."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, slow_call_seconds: float = 1.5, reset_timeout_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Whether a call may go out. After the reset timeout a single trial call is let through."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self, duration: float):
+        """Record a completed call. Slow calls count as failures."""
+        if duration > self.slow_call_seconds:
+            self.record_failure()
+            return
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"🚨 Reranker circuit breaker opened after {self.consecutive_failures} failed or slow calls")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+@lru_cache(maxsize=None)
+def get_circuit_breaker() -> CircuitBreaker:
+    """Return the process-wide breaker shared by every CohereReranker."""
+    return CircuitBreaker(
+        failure_threshold=RERANKER_CONFIG["failure_threshold"],
+        slow_call_seconds=RERANKER_CONFIG["slow_call_seconds"],
+        reset_timeout_seconds=RERANKER_CONFIG["reset_timeout_seconds"],
+    )
+
+
 class CohereReranker:
-    def __init__(self):
-        self.co = cohere.Client(os.getenv("COHERE_API_KEY"))
-    
-    def rerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Tuple[str, float]]:
-        """Rerank documents using Cohere's rerank API."""
+    def __init__(self, model: str = RERANK_MODEL, timeout_seconds: float = None, breaker: CircuitBreaker = None):
+        self.model = model
+        self.timeout_seconds = timeout_seconds or RERANKER_CONFIG["timeout_seconds"]
+        self.breaker = breaker or get_circuit_breaker()
+        self._co = None
+        self._async_co = None
+
+    @property
+    def co(self):
+        """Cohere client, created on first use."""
+        if self._co is None:
+            import cohere
+            self._co = cohere.Client(os.getenv("COHERE_API_KEY"), timeout=self.timeout_seconds)
+        return self._co
+
+    @property
+    def async_co(self):
+        """Async Cohere client, created on first use."""
+        if self._async_co is None:
+            import cohere
+            self._async_co = cohere.AsyncClient(os.getenv("COHERE_API_KEY"), timeout=self.timeout_seconds)
+        return self._async_co
+
+    def _request_kwargs(self, query: str, documents: List[str], top_k: int) -> dict:
+        # Results are mapped back by index, so document bodies are not sent back
+        return {
+            "model": self.model,
+            "query": query,
+            "documents": documents,
+            "top_n": top_k,
+            "return_documents": False,
+            "request_options": {"timeout_in_seconds": math.ceil(self.timeout_seconds), "max_retries": 0},
+        }
+
+    def rerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Tuple[int, float, str]]:
+        """Rerank documents using Cohere's rerank API.
+
+        Returns (index, score, method) tuples, where index points into documents and method
+        is "cohere" or, when Cohere is failing or the circuit breaker is open, "bm25_fallback".
+        """
         if not documents:
             return []
-        
+
+        if not self.breaker.allow_request():
+            return self._fallback(query, documents, top_k)
+
+        start = time.monotonic()
         try:
-            response = self.co.rerank(
-                model="rerank-english-v3.0",  # Standard Cohere rerank model
-                query=query,
-                documents=documents,
-                top_n=top_k,
-                return_documents=True
-            )
-            
-            return [(result.document.text, result.relevance_score) 
-                    for result in response.results]
+            response = self.co.rerank(**self._request_kwargs(query, documents, top_k))
         except Exception as e:
+            self.breaker.record_failure()
             print(f"⚠️ Reranking failed: {e}")
-            # Fallback: return first top_k documents
-            return [(doc, 1.0) for doc in documents[:top_k]]
+            return self._fallback(query, documents, top_k)
+        except BaseException:
+            # An interrupted trial call must not leave the breaker half-open forever
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success(time.monotonic() - start)
+        return [(result.index, result.relevance_score, COHERE_METHOD)
+                for result in response.results]
+
+    async def arerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Tuple[int, float, str]]:
+        """Async version of rerank, with a hard deadline on the Cohere call."""
+        if not documents:
+            return []
+
+        if not self.breaker.allow_request():
+            return self._fallback(query, documents, top_k)
+
+        start = time.monotonic()
+        try:
+            response = await asyncio.wait_for(
+                self.async_co.rerank(**self._request_kwargs(query, documents, top_k)),
+                timeout=self.timeout_seconds,
+            )
+        except Exception as e:
+            self.breaker.record_failure()
+            print(f"⚠️ Reranking failed: {e!r}")
+            return self._fallback(query, documents, top_k)
+        except BaseException:
+            # Cancellation, e.g. by the caller's deadline, counts as a failed trial
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success(time.monotonic() - start)
+        return [(result.index, result.relevance_score, COHERE_METHOD)
+                for result in response.results]
+
+    def _fallback(self, query: str, documents: List[str], top_k: int) -> List[Tuple[int, float, str]]:
+        """Rank candidates locally with BM25 over the candidate set."""
+        print("⚠️ Using local BM25 fallback ranking")
+        scores = score_texts(query, documents)
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)[:top_k]
+        return [(i, scores[i], FALLBACK_METHOD) for i in order]
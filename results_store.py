@@ -0,0 +1,216 @@
+"""
+Results Store for Medical RAG System
+Structured, buffered JSONL records of each evaluation run, and run-to-run comparison.
+
+Each record holds one golden question's answer, the parsed judge scores, per-node latency
+and token usage from the workflow tracer, and whether the reranker was enabled.
+
+Compare two runs with:
+    python results_store.py compare results/baseline.jsonl results/candidate.jsonl
+"""
+
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+
+RESULTS_DIRECTORY = "./results"
+
+COMPARE_CONFIG = {
+    "score_drop": 1.0,            # A question regresses if a judge score drops by at least this much
+    "latency_increase": 0.25,     # ... or its total time grows by more than this fraction
+    "latency_min_seconds": 0.5,   # ... and by at least this many seconds, to ignore network jitter
+}
+
+# The judge prompts end with these lines (judge_answer_split.py)
+CONTEXT_SCORE_PATTERN = re.compile(r"Context Score:\**\s*(-?\d+(?:\.\d+)?)", re.IGNORECASE)
+ANSWER_SCORE_PATTERN = re.compile(r"(?:Final|Answer) Score:\**\s*(-?\d+(?:\.\d+)?)", re.IGNORECASE)
+
+# Header of the answer judgment in the combined feedback (format_judge_feedback)
+ANSWER_SECTION_HEADER = "=== ANSWER EVALUATION ==="
+
+SCORE_KEYS = ("context_score", "answer_score")
+
+
+def parse_scores(judge_feedback: Optional[str]) -> Dict[str, Optional[float]]:
+    """Extract the context and answer scores from the combined judge feedback text.
+
+    Each score is read from its own judgment, so neither judge can overwrite the other's.
+    """
+    context_text, header, answer_text = (judge_feedback or "").partition(ANSWER_SECTION_HEADER)
+    if not header:
+        answer_text = context_text
+
+    def last_match(pattern, text):
+        matches = pattern.findall(text)
+        return float(matches[-1]) if matches else None
+
+    return {
+        "context_score": last_match(CONTEXT_SCORE_PATTERN, context_text),
+        "answer_score": last_match(ANSWER_SCORE_PATTERN, answer_text),
+    }
+
+
+def node_metrics(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Total latency per node and token usage across one question's spans."""
+    latency: Dict[str, float] = {}
+    for span in spans:
+        latency[span["node"]] = latency.get(span["node"], 0.0) + span["duration_ms"]
+
+    return {
+        "node_latency_ms": {node: round(value, 1) for node, value in latency.items()},
+        "prompt_tokens": sum(span.get("prompt_tokens", 0) for span in spans),
+        "completion_tokens": sum(span.get("completion_tokens", 0) for span in spans),
+        "rewrites": max((span.get("iteration", 0) for span in spans), default=0),
+    }
+
+
+def default_results_path() -> str:
+    return os.path.join(RESULTS_DIRECTORY, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl")
+
+
+class ResultsStore:
+    """Buffers result records in memory and writes them to a JSONL file in one go."""
+
+    def __init__(self, path: Optional[str] = None, use_reranker: bool = True, run_id: Optional[str] = None):
+        self.path = path or default_results_path()
+        self.use_reranker = use_reranker
+        self.run_id = run_id or datetime.now().isoformat(timespec="seconds")
+        self._records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, question_data: dict, system_answer: Optional[str], judge_feedback: Optional[str],
+            timings: Optional[dict] = None, spans: Optional[List[Dict[str, Any]]] = None):
+        """Buffer the record for one question."""
+        record = {
+            "run_id": self.run_id,
+            "question_id": question_data["id"],
+            "category": question_data.get("category"),
+            "difficulty": question_data.get("difficulty"),
+            "question": question_data["text"],
+            "reranker": self.use_reranker,
+            "answer": system_answer,
+            **parse_scores(judge_feedback),
+            "timings": timings or {},
+            **node_metrics(spans or []),
+            "judge_feedback": judge_feedback,
+        }
+        with self._lock:
+            self._records.append(record)
+
+    def flush(self):
+        """Append buffered records to the results file."""
+        with self._lock:
+            records, self._records = self._records, []
+        if not records:
+            return
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+
+
+def load_results(path: str) -> Dict[str, Dict[str, Any]]:
+    """Load a results file keyed by question ID."""
+    with open(path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return {record["question_id"]: record for record in records}
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+
+def compare_runs(baseline: Dict[str, Dict[str, Any]], candidate: Dict[str, Dict[str, Any]],
+                 score_drop: float, latency_increase: float, latency_min_seconds: float) -> List[str]:
+    """Return a line per regression in candidate compared with baseline, for questions in both runs.
+
+    A judged record whose score could not be parsed, or a baseline score with no candidate
+    judgment, is a regression too, since it cannot be compared.
+    """
+    regressions = []
+    for question_id in baseline:
+        if question_id not in candidate:
+            continue
+        before, after = baseline[question_id], candidate[question_id]
+
+        for label, record in (("baseline", before), ("candidate", after)):
+            for score in SCORE_KEYS:
+                if record.get("judge_feedback") and record.get(score) is None:
+                    regressions.append(f"{question_id}: {score} could not be parsed from the {label} judge feedback")
+
+        for score in SCORE_KEYS:
+            if before.get(score) is not None and after.get(score) is None and not after.get("judge_feedback"):
+                regressions.append(f"{question_id}: {score} {before[score]:g} -> not judged")
+            elif before.get(score) is not None and after.get(score) is not None \
+                    and before[score] - after[score] >= score_drop:
+                regressions.append(f"{question_id}: {score} {before[score]:g} -> {after[score]:g}")
+
+        before_time = before.get("timings", {}).get("total_time")
+        after_time = after.get("timings", {}).get("total_time")
+        if before_time and after_time and after_time - before_time >= latency_min_seconds \
+                and after_time > before_time * (1 + latency_increase):
+            regressions.append(f"{question_id}: total_time {before_time:.2f}s -> {after_time:.2f}s")
+
+    return regressions
+
+
+def print_comparison(baseline_path: str, candidate_path: str, score_drop: float,
+                     latency_increase: float, latency_min_seconds: float) -> int:
+    baseline, candidate = load_results(baseline_path), load_results(candidate_path)
+    shared = [question_id for question_id in baseline if question_id in candidate]
+    print(f"📊 Comparing {len(shared)} shared questions: {baseline_path} -> {candidate_path}")
+
+    for label, key in (("Context score", "context_score"), ("Answer score", "answer_score")):
+        before = _mean([baseline[question_id].get(key) for question_id in shared])
+        after = _mean([candidate[question_id].get(key) for question_id in shared])
+        if before is not None and after is not None:
+            print(f"   {label}: {before:.2f} -> {after:.2f} ({after - before:+.2f})")
+
+    before = _mean([baseline[question_id].get("timings", {}).get("total_time") for question_id in shared])
+    after = _mean([candidate[question_id].get("timings", {}).get("total_time") for question_id in shared])
+    if before is not None and after is not None:
+        print(f"   Mean total time: {before:.2f}s -> {after:.2f}s ({after - before:+.2f}s)")
+
+    nodes = sorted({node for question_id in shared for node in baseline[question_id].get("node_latency_ms", {})})
+    for node in nodes:
+        before = _mean([baseline[question_id].get("node_latency_ms", {}).get(node) for question_id in shared])
+        after = _mean([candidate[question_id].get("node_latency_ms", {}).get(node) for question_id in shared])
+        if before is not None and after is not None:
+            print(f"   {node}: {before:.0f}ms -> {after:.0f}ms")
+
+    regressions = compare_runs(baseline, candidate, score_drop, latency_increase, latency_min_seconds)
+    if regressions:
+        print(f"❌ {len(regressions)} regressions:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+
+    print("✅ No regressions")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Medical RAG evaluation results")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    compare = subcommands.add_parser("compare", help="Diff two runs and flag score or latency regressions")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--score-drop", type=float, default=COMPARE_CONFIG["score_drop"])
+    compare.add_argument("--latency-increase", type=float, default=COMPARE_CONFIG["latency_increase"])
+    compare.add_argument("--latency-min-seconds", type=float, default=COMPARE_CONFIG["latency_min_seconds"])
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        sys.exit(print_comparison(args.baseline, args.candidate, args.score_drop,
+                                  args.latency_increase, args.latency_min_seconds))
+
+
+if __name__ == "__main__":
+    main()
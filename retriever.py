@@ -1,49 +1,350 @@
-
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
-from langchain_core.vectorstores import VectorStoreRetriever
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
+from markdown_splitter import MarkdownSplitter, source_category, source_subtype
+from numpy_vectorstore import NumpyVectorStore
 from reranked_retriever import RerankedRetriever
+from hybrid_retriever import HybridRetriever
+from query_router import RoutedVectorRetriever, ROUTER_CONFIG
+from bm25_index import BM25Index
+from rerank_cache import get_rerank_cache
+from semantic_cache import SemanticCacheRetriever, SEMANTIC_CACHE_CONFIG
+from embedding_cache import get_embeddings
+from atomic_write import atomic_write
+from collections import defaultdict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
 import glob
 import hashlib
+import json
+import os
 
 import config
 
 # Configuration
 RETRIEVER_CONFIG = {
+    "backend": "chroma",          # "chroma" or "numpy" (in-process index for small corpora)
     "search_type": "similarity",  # Use similarity search for better scoring
-    "search_kwargs": {"k": 25}    # Get 25 documents to allow reranker to choose from
+    "search_kwargs": {"k": 25},   # Get 25 documents to allow reranker to choose from
+    "hybrid": True,               # Fuse BM25 keyword matches with the vector results
+    "bm25_k": 25,                 # Keyword candidates fed into the fusion
+    "rrf_k": 60,                  # Reciprocal rank fusion constant
+    "fused_k": 15                 # Candidates passed on after fusion
 }
 
-def generate_patient_data_checksum(patient_id: str) -> str:
-    """Generate checksum for all patient data files."""
+CHUNKING_CONFIG = {
+    "splitter": "markdown",       # "markdown" (sections, whole tables, no overlap) or "recursive"
+    "max_chunk_chars": 1200,      # Markdown splitter: chunk size limit, exceeded only by a single large table
+    "chunk_size": 1000,           # Recursive splitter settings
+    "chunk_overlap": 250,
+    "tags": ["category", "subtype"],  # Path-derived metadata on every chunk, used by the query router
+}
+
+PERSIST_DIRECTORY = "./chroma_db"
+
+# All collections are served by one shared client, which unloads the least recently used past this size
+CHROMA_MEMORY_LIMIT_BYTES = 2 * 1024 ** 3
+
+# Changed files are hashed in parallel, streamed in blocks of this size
+HASH_WORKERS = 8
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Files are read by a pool of this many threads
+READ_WORKERS = 8
+
+def _hash_file(file_path: str) -> str:
+    """Stream a file through sha256 without loading it into memory at once."""
     hasher = hashlib.sha256()
-    markdown_files = sorted(glob.glob(f"data/{patient_id}/**/*.md", recursive=True))
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _manifest_path(patient_id: str) -> str:
+    return os.path.join(PERSIST_DIRECTORY, "manifests", f"patient_{patient_id}.json")
+
+
+def _load_manifest(patient_id: str) -> Dict[str, dict]:
+    """Load the stored (size, mtime_ns, sha256) manifest for a patient."""
+    try:
+        with open(_manifest_path(patient_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(patient_id: str, manifest: Dict[str, dict]):
+    """Atomically write the manifest next to the collection.
+    
+    Checksums are computed concurrently (pool opens, the semantic cache, ingestion), so
+    every writer gets its own temporary file and the last complete manifest wins.
+    """
+    with atomic_write(_manifest_path(patient_id)) as f:
+        json.dump(manifest, f)
+
+
+def generate_file_checksums(patient_id: str) -> Dict[str, str]:
+    """Generate a content checksum for each patient data file.
+    
+    Files whose size and mtime match the stored manifest are not read at all.
+    The remaining files are hashed in parallel.
+    """
+    manifest = _load_manifest(patient_id)
+    new_manifest = {}
+    to_hash = []
+    
+    for file_path in sorted(glob.glob(f"data/{patient_id}/**/*.md", recursive=True)):
+        stat = os.stat(file_path)
+        entry = manifest.get(file_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            new_manifest[file_path] = entry
+        else:
+            new_manifest[file_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            to_hash.append(file_path)
+    
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+            for file_path, sha256 in zip(to_hash, executor.map(_hash_file, to_hash)):
+                new_manifest[file_path]["sha256"] = sha256
     
-    for file_path in markdown_files:
+    if new_manifest != manifest:
+        _save_manifest(patient_id, new_manifest)
+    
+    return {file_path: entry["sha256"] for file_path, entry in new_manifest.items()}
+
+
+def generate_patient_data_checksum(patient_id: str, file_checksums: Optional[Dict[str, str]] = None) -> str:
+    """Generate checksum for all patient data files."""
+    if file_checksums is None:
+        file_checksums = generate_file_checksums(patient_id)
+    
+    hasher = hashlib.sha256()
+    for file_path in sorted(file_checksums):
         hasher.update(file_path.encode())
-        with open(file_path, 'rb') as f:
-            hasher.update(f.read())
+        hasher.update(file_checksums[file_path].encode())
     
     return hasher.hexdigest()
 
 
-def load_documents(patient_id: str):
-    """Load and split patient documents."""
-    # Load all markdown files
-    documents = []
-    for file_path in glob.glob(f"data/{patient_id}/**/*.md", recursive=True):
-        loader = TextLoader(file_path, encoding='utf-8')
-        documents.extend(loader.load())
+def chunker_signature() -> str:
+    """Short hash of CHUNKING_CONFIG, stored with every chunk."""
+    return hashlib.sha256(json.dumps(CHUNKING_CONFIG, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def generate_index_checksum(patient_id: str, file_checksums: Optional[Dict[str, str]] = None) -> str:
+    """Checksum of the patient data and the chunking settings, so an index is rebuilt when either changes."""
+    data_checksum = generate_patient_data_checksum(patient_id, file_checksums)
+    return hashlib.sha256(f"{data_checksum}:{chunker_signature()}".encode()).hexdigest()
+
+
+def read_document(file_path: str, source_hash: str):
+    """Load one markdown file, tagged with its content checksum."""
+    from langchain_community.document_loaders import TextLoader
+
+    documents = TextLoader(file_path, encoding='utf-8').load()
+    for doc in documents:
+        doc.metadata["source_hash"] = source_hash
+    return documents
+
+
+def split_documents(documents):
+    """Split loaded files into chunks, numbered within each file so they get stable IDs.
+    
+    Every chunk is tagged with the category and sub-type of its file (e.g. labs, labs/thyroid).
+    """
+    if CHUNKING_CONFIG["splitter"] == "markdown":
+        text_splitter = MarkdownSplitter(max_chunk_chars=CHUNKING_CONFIG["max_chunk_chars"])
+    else:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNKING_CONFIG["chunk_size"], 
+            chunk_overlap=CHUNKING_CONFIG["chunk_overlap"], 
+            separators=["\n---\n", "\n# ", "\n## ", "\n"]
+        )
+    doc_splits = text_splitter.split_documents(documents)
+    
+    signature = chunker_signature()
+    chunk_counts = defaultdict(int)
+    for doc in doc_splits:
+        source = doc.metadata["source"]
+        doc.metadata["chunk_index"] = chunk_counts[source]
+        doc.metadata["chunker"] = signature
+        doc.metadata["category"] = source_category(source)
+        doc.metadata["subtype"] = source_subtype(source)
+        chunk_counts[source] += 1
+    
+    return doc_splits
+
+
+def load_documents(patient_id: str, file_checksums: Optional[Dict[str, str]] = None):
+    """Load and split patient documents.
+    
+    Args:
+        patient_id: The patient ID to load documents for
+        file_checksums: Optional mapping of file path to content checksum. Only these
+            files are loaded. If omitted, every markdown file of the patient is loaded.
+    """
+    if file_checksums is None:
+        file_checksums = generate_file_checksums(patient_id)
+    
+    # Read the markdown files in parallel, keeping them in path order
+    items = sorted(file_checksums.items())
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        loaded = executor.map(read_document, [path for path, _ in items], [source_hash for _, source_hash in items])
+        documents = [doc for file_docs in loaded for doc in file_docs]
+    
+    return split_documents(documents)
+
+
+def chunk_id(doc) -> str:
+    """Stable ID for a chunk, derived from its source file, file checksum and position."""
+    key = f"{doc.metadata['source']}:{doc.metadata['source_hash']}:{doc.metadata['chunk_index']}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def plan_sync(vectorstore, file_checksums: Dict[str, str]) -> Tuple[Dict[str, str], list, int]:
+    """Compare a vector store with the patient files.
     
-    # Split into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, 
-        chunk_overlap=250, 
-        separators=["\n---\n", "\n# ", "\n## ", "\n"]
+    Returns:
+        Tuple of (added or changed files with their checksums, IDs of stale chunks
+        to delete, number of chunks currently stored)
+    """
+    stored = vectorstore.get(include=["metadatas"])
+    
+    # Group stored chunks by their source file; chunks made with other chunking settings count as changed
+    signature = chunker_signature()
+    ids_by_source = defaultdict(list)
+    hashes_by_source = defaultdict(set)
+    for doc_id, metadata in zip(stored["ids"], stored["metadatas"]):
+        metadata = metadata or {}
+        source = metadata.get("source")
+        ids_by_source[source].append(doc_id)
+        hashes_by_source[source].add((metadata.get("source_hash"), metadata.get("chunker")))
+    
+    changed_files = {
+        file_path: source_hash
+        for file_path, source_hash in file_checksums.items()
+        if hashes_by_source.get(file_path) != {(source_hash, signature)}
+    }
+    removed_files = [source for source in ids_by_source if source not in file_checksums]
+    
+    stale_ids = []
+    for source in list(changed_files) + removed_files:
+        stale_ids.extend(ids_by_source.get(source, []))
+    
+    print(f"📂 Files - Added/changed: {len(changed_files)} | Removed: {len(removed_files)} | Unchanged: {len(file_checksums) - len(changed_files)}")
+    return changed_files, stale_ids, len(stored["ids"])
+
+
+def max_write_batch_size(vectorstore) -> Optional[int]:
+    """Most records one add or delete call may carry, or None if the backend has no limit."""
+    if isinstance(vectorstore, NumpyVectorStore):
+        return None
+    return vectorstore._client.get_max_batch_size()
+
+
+def _batches(items: list, batch_size: Optional[int]):
+    if not batch_size:
+        yield items
+        return
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def add_in_batches(vectorstore, docs: list):
+    """Add chunks under their stable IDs, split into calls the backend accepts."""
+    for batch in _batches(docs, max_write_batch_size(vectorstore)):
+        if batch:
+            vectorstore.add_documents(batch, ids=[chunk_id(doc) for doc in batch])
+
+
+def delete_in_batches(vectorstore, ids: list):
+    """Delete chunks by ID, split into calls the backend accepts."""
+    for batch in _batches(ids, max_write_batch_size(vectorstore)):
+        if batch:
+            vectorstore.delete(ids=batch)
+
+
+def sync_vectorstore(vectorstore, patient_id: str, file_checksums: Dict[str, str]) -> Tuple[int, int]:
+    """Bring a vector store in line with the patient files, re-embedding only what changed.
+    
+    Chunks of files that were added or changed are (re-)embedded, chunks of changed or
+    removed files are deleted, and chunks of unchanged files are kept as they are.
+    
+    Returns:
+        Tuple of (reused chunk count, embedded chunk count)
+    """
+    changed_files, stale_ids, stored_count = plan_sync(vectorstore, file_checksums)
+    
+    delete_in_batches(vectorstore, stale_ids)
+    
+    new_docs = load_documents(patient_id, changed_files) if changed_files else []
+    add_in_batches(vectorstore, new_docs)
+    
+    reused = stored_count - len(stale_ids)
+    print(f"♻️  Reused {reused} chunks | 🧮 Embedded {len(new_docs)} chunks | 🗑️  Deleted {len(stale_ids)} chunks")
+    return reused, len(new_docs)
+
+
+@lru_cache(maxsize=None)
+def get_chroma_client():
+    """Return the process-wide Chroma client shared by every patient collection."""
+    import chromadb
+    from chromadb.config import Settings
+
+    return chromadb.PersistentClient(
+        path=PERSIST_DIRECTORY,
+        settings=Settings(
+            chroma_segment_cache_policy="LRU",
+            chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT_BYTES,
+        ),
     )
-    return text_splitter.split_documents(documents)
+
+
+def open_vectorstore(collection_name: str):
+    """Open (or create) a collection with the backend selected in RETRIEVER_CONFIG."""
+    backend = RETRIEVER_CONFIG["backend"]
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        return Chroma(
+            client=get_chroma_client(),
+            collection_name=collection_name,
+            embedding_function=get_embeddings(),
+            # Collections use squared L2 distance; on normalised embeddings 1 - d / 2 is the
+            # cosine similarity, the same relevance scale as the numpy backend
+            relevance_score_fn=lambda distance: 1.0 - distance / 2,
+        )
+    if backend == "numpy":
+        return NumpyVectorStore(
+            collection_name=collection_name,
+            embedding_function=get_embeddings(),
+            persist_directory=PERSIST_DIRECTORY
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def _get_collection_metadata(vectorstore) -> dict:
+    if isinstance(vectorstore, NumpyVectorStore):
+        return vectorstore.metadata
+    return vectorstore._collection.metadata or {}
+
+
+def _set_collection_metadata(vectorstore, metadata: dict):
+    if isinstance(vectorstore, NumpyVectorStore):
+        vectorstore.modify(metadata)
+    else:
+        vectorstore._collection.modify(metadata=metadata)
+
+
+def load_bm25_index(vectorstore, collection_name: str, checksum: str) -> BM25Index:
+    """Load the persisted BM25 index for a collection, rebuilding it when the patient data changed."""
+    path = os.path.join(PERSIST_DIRECTORY, "bm25", f"{collection_name}.json")
+    bm25_index = BM25Index.load(path, checksum)
+    if bm25_index is None:
+        print("🔄 Building BM25 index...")
+        bm25_index = BM25Index.from_vectorstore(vectorstore)
+        bm25_index.save(path, checksum)
+    return bm25_index
+
 
 def create_retriever(patient_id, use_reranker=True):
     """Create a retriever with optional reranking for the given patient.
@@ -52,49 +353,66 @@ def create_retriever(patient_id, use_reranker=True):
         patient_id: The patient ID to create retriever for
         use_reranker: If True, wrap with RerankedRetriever. If False, return base retriever only.
     """
-    current_checksum = generate_patient_data_checksum(patient_id)
+    file_checksums = generate_file_checksums(patient_id)
+    current_checksum = generate_index_checksum(patient_id, file_checksums)
     collection_name = f"patient_{patient_id}"
     
-    # Try to load existing collection
-    try:
-        vectorstore = Chroma(
-            collection_name=collection_name,
-            embedding_function=OpenAIEmbeddings(model="text-embedding-3-small"),
-            persist_directory="./chroma_db"
-        )
-        
-        stored_checksum = vectorstore._collection.metadata.get("checksum") if vectorstore._collection.metadata else None
-        
-        print(f"🔍 Checksum - Current: {current_checksum[:12]}... | Stored: {stored_checksum[:12] if stored_checksum else 'None'}...")
-        
-        if stored_checksum == current_checksum:
-            print("✅ Using existing embeddings")
-        else:
-            print("🔄 Rebuilding embeddings...")
-            vectorstore._client.delete_collection(collection_name)
-            raise Exception("Checksum mismatch - rebuild needed")
-            
-    except Exception:
-        # Build new embeddings
-        print("🔄 Loading documents...")
-        doc_splits = load_documents(patient_id)
-        print(f"📄 Processing {len(doc_splits)} chunks...")
-        
-        vectorstore = Chroma.from_documents(
-            documents=doc_splits,
-            embedding=OpenAIEmbeddings(model="text-embedding-3-small"),
-            collection_name=collection_name,
-            persist_directory="./chroma_db"
-        )
-        vectorstore._collection.modify(metadata={"checksum": current_checksum})
+    # Open the collection, creating it if it does not exist yet
+    vectorstore = open_vectorstore(collection_name)
+    stored_checksum = _get_collection_metadata(vectorstore).get("checksum")
+    
+    print(f"🔍 Checksum - Current: {current_checksum[:12]}... | Stored: {stored_checksum[:12] if stored_checksum else 'None'}...")
+    
+    if stored_checksum == current_checksum:
+        print("✅ Using existing embeddings")
+    else:
+        # Re-embed only the files that were added or changed
+        print("🔄 Updating embeddings...")
+        sync_vectorstore(vectorstore, patient_id, file_checksums)
+        _set_collection_metadata(vectorstore, {"checksum": current_checksum})
         print("✅ Embeddings ready")
     
     # Create base retriever and optionally wrap with reranking
-    base_retriever = vectorstore.as_retriever(**RETRIEVER_CONFIG)
+    if ROUTER_CONFIG["enabled"]:
+        print("🔧 Enabling category routing")
+        base_retriever = RoutedVectorRetriever(
+            vectorstore=vectorstore,
+            k=RETRIEVER_CONFIG["search_kwargs"]["k"],
+            min_results=ROUTER_CONFIG["min_results"],
+            min_score=ROUTER_CONFIG["min_score"],
+        )
+    else:
+        base_retriever = vectorstore.as_retriever(
+            search_type=RETRIEVER_CONFIG["search_type"],
+            search_kwargs=RETRIEVER_CONFIG["search_kwargs"],
+        )
+    
+    if RETRIEVER_CONFIG["hybrid"]:
+        print("🔧 Enabling hybrid BM25 + vector search")
+        base_retriever = HybridRetriever(
+            vector_retriever=base_retriever,
+            bm25_index=load_bm25_index(vectorstore, collection_name, current_checksum),
+            bm25_k=RETRIEVER_CONFIG["bm25_k"],
+            rrf_k=RETRIEVER_CONFIG["rrf_k"],
+            k=RETRIEVER_CONFIG["fused_k"],
+        )
     
     if use_reranker:
         print("🔧 Enabling reranker")
-        return RerankedRetriever(base_retriever, top_k=5)
+        retriever = RerankedRetriever(base_retriever, top_k=5, cache=get_rerank_cache())
     else:
         print("🔧 Reranker disabled - using base retriever only")
-        return base_retriever
\ No newline at end of file
+        retriever = base_retriever
+    
+    if SEMANTIC_CACHE_CONFIG["enabled"]:
+        print("🔧 Enabling semantic query cache")
+        retriever = SemanticCacheRetriever(
+            retriever=retriever,
+            embeddings=get_embeddings(),
+            checksum_fn=lambda: generate_patient_data_checksum(patient_id),
+            similarity_threshold=SEMANTIC_CACHE_CONFIG["similarity_threshold"],
+            max_entries=SEMANTIC_CACHE_CONFIG["max_entries"],
+            checksum_check_seconds=SEMANTIC_CACHE_CONFIG["checksum_check_seconds"],
+        )
+    
+    return retriever
@@ -0,0 +1,173 @@
+"""
+Retriever Pool for Medical RAG System
+Serves retrievers for many patients from one process, keyed by patient ID.
+
+Retrievers are opened lazily from the shared Chroma client on first use. Concurrent first
+requests for the same patient wait on a single open. Least recently used patients are
+evicted once the estimated memory of the open retrievers exceeds the cap.
+"""
+
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.tools import StructuredTool
+from langgraph.prebuilt import InjectedState
+from pydantic import BaseModel, Field
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Annotated, Dict, List, Optional, Tuple
+import asyncio
+import glob
+import os
+import re
+import threading
+
+from retriever import create_retriever, CHROMA_MEMORY_LIMIT_BYTES
+
+DEFAULT_PATIENT_ID = "drapoel"
+
+RETRIEVER_POOL_CONFIG = {
+    "max_memory_bytes": CHROMA_MEMORY_LIMIT_BYTES,
+    # Rough in-memory cost per byte of patient markdown: a ~1,000 character chunk
+    # carries a 6 KB float32 embedding plus its text, BM25 postings and index links
+    "bytes_per_source_byte": 10,
+}
+
+PATIENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def estimate_patient_memory(patient_id: str) -> int:
+    """Estimated memory held by an open retriever for a patient, from the size of their files."""
+    files = glob.glob(f"data/{patient_id}/**/*.md", recursive=True)
+    return sum(os.path.getsize(path) for path in files) * RETRIEVER_POOL_CONFIG["bytes_per_source_byte"]
+
+
+def validate_patient_id(patient_id: str):
+    """Reject IDs that are malformed or have no data directory."""
+    # Patient IDs can come from request state, so never let them escape data/
+    if not PATIENT_ID_PATTERN.match(patient_id or ""):
+        raise ValueError(f"Invalid patient ID: {patient_id!r}")
+    if not os.path.isdir(os.path.join("data", patient_id)):
+        raise ValueError(f"No data found for patient: {patient_id}")
+
+
+class RetrieverPool:
+    """LRU pool of per-patient retrievers with single-flight opens."""
+
+    def __init__(self, use_reranker: bool = True, max_memory_bytes: Optional[int] = None):
+        self.use_reranker = use_reranker
+        self.max_memory_bytes = max_memory_bytes or RETRIEVER_POOL_CONFIG["max_memory_bytes"]
+        self._entries: "OrderedDict[str, Tuple[BaseRetriever, int]]" = OrderedDict()
+        self._opening: Dict[str, Future] = {}
+        self._memory = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _cached(self, patient_id: str) -> Optional[BaseRetriever]:
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(patient_id)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, patient_id: str) -> BaseRetriever:
+        """Return the retriever for a patient, opening it on first use."""
+        retriever = self._cached(patient_id)
+        if retriever is not None:
+            return retriever
+
+        with self._lock:
+            # Another thread may have finished opening it since the check above
+            if patient_id in self._entries:
+                self._entries.move_to_end(patient_id)
+                self.hits += 1
+                return self._entries[patient_id][0]
+            future = self._opening.get(patient_id)
+            is_opener = future is None
+            if is_opener:
+                future = self._opening[patient_id] = Future()
+
+        if not is_opener:
+            return future.result()
+
+        try:
+            validate_patient_id(patient_id)
+            retriever = create_retriever(patient_id, use_reranker=self.use_reranker)
+            size = estimate_patient_memory(patient_id)
+        except Exception as e:
+            with self._lock:
+                del self._opening[patient_id]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[patient_id] = (retriever, size)
+            self._memory += size
+            self.misses += 1
+            del self._opening[patient_id]
+            self._evict()
+        future.set_result(retriever)
+        return retriever
+
+    async def aget(self, patient_id: str) -> BaseRetriever:
+        """Async version of get. First opens run in a worker thread."""
+        retriever = self._cached(patient_id)
+        if retriever is not None:
+            return retriever
+        return await asyncio.to_thread(self.get, patient_id)
+
+    def _evict(self):
+        """Drop least recently used patients until under the memory cap, always keeping the newest."""
+        while self._memory > self.max_memory_bytes and len(self._entries) > 1:
+            patient_id, (_, size) = self._entries.popitem(last=False)
+            self._memory -= size
+            self.evictions += 1
+            print(f"♻️  Evicted retriever for patient {patient_id} ({size / 1024 ** 2:.1f} MB)")
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and eviction counters, open patients and estimated memory."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "patients": len(self._entries), "memory_bytes": self._memory}
+
+
+class PatientRetrieverInput(BaseModel):
+    """Input to the patient retriever tool. The state is injected by the graph, not the model."""
+
+    query: str = Field(description="query to look up in retriever")
+    state: Annotated[dict, InjectedState]
+
+
+def _format_documents(docs: List[Document]) -> str:
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def create_patient_retriever_tool(pool: RetrieverPool, name: str, description: str,
+                                  default_patient_id: str = DEFAULT_PATIENT_ID) -> StructuredTool:
+    """Create a retriever tool that resolves the patient from graph state on every call.
+
+    Documents are returned as the tool message artifact, like create_retriever_tool
+    with response_format="content_and_artifact".
+    """
+    def retrieve(query: str, state: dict, callbacks: Callbacks = None) -> Tuple[str, List[Document]]:
+        retriever = pool.get(state.get("patient_id") or default_patient_id)
+        docs = retriever.invoke(query, config={"callbacks": callbacks})
+        return _format_documents(docs), docs
+
+    async def aretrieve(query: str, state: dict, callbacks: Callbacks = None) -> Tuple[str, List[Document]]:
+        retriever = await pool.aget(state.get("patient_id") or default_patient_id)
+        docs = await retriever.ainvoke(query, config={"callbacks": callbacks})
+        return _format_documents(docs), docs
+
+    return StructuredTool.from_function(
+        func=retrieve,
+        coroutine=aretrieve,
+        name=name,
+        description=description,
+        args_schema=PatientRetrieverInput,
+        response_format="content_and_artifact",
+    )
@@ -3,22 +3,14 @@ Medical Question Rewriter for RAG System
 Rewrites user questions to be more specific and medical-focused.
 """
 
-from langgraph.graph import MessagesState
-from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage
 from custom_state import MedicalRAGState
+from budget import budget_exhausted, report_exhausted, usage_tokens
 from typing import Dict, Any
 
 # Load shared configuration (includes dotenv loading)
 import config
 
-from langgraph.graph import MessagesState
-from langchain.chat_models import init_chat_model
-from langchain_core.messages import HumanMessage
-
-# Load shared configuration
-import config
-
 REWRITE_PROMPT = (
     "You are a medical question rewriter. Look at the input and try to reason about the underlying semantic intent / meaning.\n"
     "The available medical data includes: patient intake information, medications (prescriptions and supplements), "
@@ -35,21 +27,45 @@ REWRITE_PROMPT = (
     "\n ------- \n"
     "{question}"
     "\n ------- \n"
+    "{previous_attempts}"
     "Rewrite this question to be more specific and use proper medical terminology that would help retrieve relevant medical information. "
     "Focus on the specific data type most relevant to the question (labs, medications, imaging, etc.).\n"
     "Formulate an improved medical question:"
 )
 
-# Initialize the rewriter model
-rewriter_model = init_chat_model("openai:gpt-4o", temperature=0)
+PREVIOUS_ATTEMPTS_PROMPT = (
+    "These rewrites were already tried and did not retrieve relevant information. "
+    "Take a different angle, such as another data category or more specific terms:\n"
+    "{attempts}\n\n"
+)
+
 
 def rewrite_question(state: MedicalRAGState) -> Dict[str, Any]:
-    """Rewrite the original user question to be more medically specific."""
+    """Rewrite the original user question to be more medically specific.
+    
+    Earlier rewrites are included in the prompt, so that a retry does not produce the
+    same query again.
+    """
+    reason = budget_exhausted(state)
+    if reason:
+        report_exhausted("rewrite_question", reason)
+        return {}
+    
     messages = state["messages"]
     question = messages[0].content
+    # Every rewrite so far was added to the conversation as a human message
+    attempts = [message.content for message in messages[1:] if isinstance(message, HumanMessage)]
+    previous_attempts = (
+        PREVIOUS_ATTEMPTS_PROMPT.format(attempts="\n".join(f"- {attempt}" for attempt in attempts))
+        if attempts else ""
+    )
     
-    prompt = REWRITE_PROMPT.format(question=question)
-    response = rewriter_model.invoke([{"role": "user", "content": prompt}])
+    prompt = REWRITE_PROMPT.format(question=question, previous_attempts=previous_attempts)
+    response = config.get_chat_model().invoke([{"role": "user", "content": prompt}])
     
     # Return a proper HumanMessage object instead of dictionary
-    return {"messages": [HumanMessage(content=response.content)]}
+    return {
+        "messages": [HumanMessage(content=response.content)],
+        "rewrite_count": state.get("rewrite_count", 0) + 1,
+        "tokens_used": usage_tokens(response),
+    }
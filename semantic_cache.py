@@ -0,0 +1,161 @@
+"""
+Semantic Query Cache for Medical RAG System
+Serves stored retrieval results for queries that are paraphrases of recent ones,
+skipping vector search and reranking entirely.
+
+Questions that differ only in the lab analyte or drug they ask about ("LDL" vs "HDL",
+"TSH" vs "T4") embed almost identically, so a hit also requires both queries to mention
+the same exact terms. The cache is off by default until its threshold has been checked
+against the golden questions.
+"""
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+import re
+import threading
+import time
+
+import numpy as np
+
+from reranker import COHERE_METHOD
+import tracing
+
+SEMANTIC_CACHE_CONFIG = {
+    "enabled": False,
+    "similarity_threshold": 0.9,     # Minimum cosine similarity between query embeddings for a hit
+    "max_entries": 256,              # Least recently used queries are evicted beyond this
+    "checksum_check_seconds": 5.0,   # How often to re-check the patient data checksum
+}
+
+# Terms two queries must share exactly for a hit: lab analytes, identifiers with digits
+# (T4, B12, rs429358) and drug names by their common suffixes
+EXACT_TERM_PATTERN = re.compile(
+    r"\b(ldl|hdl|vldl|tsh|a1c|hba1c|crp|hs-?crp|alt|ast|bun|egfr|wbc|rbc|mcv|cbc|cmp|psa|apoe|mthfr|bmd|dexa|"
+    r"cholesterol|triglycerides?|glucose|insulin|creatinine|sodium|potassium|chloride|calcium|magnesium|iron|"
+    r"ferritin|hemoglobin|hematocrit|platelets?|albumin|bilirubin|vitamin [a-z]\d*|folate|testosterone|estradiol|"
+    r"cortisol|[a-z]*\d[a-z0-9]*|[a-z]+(?:statin|pril|sartan|olol|formin|oxine|thyroxine|azole|prazole|mab|pine|"
+    r"cycline|cillin|floxacin|tidine|zepam|gliflozin|gliptin|glutide))\b"
+)
+
+
+def exact_terms(query: str) -> FrozenSet[str]:
+    """The analytes, identifiers and drug names a query mentions."""
+    return frozenset(match.replace("-", "") for match in EXACT_TERM_PATTERN.findall(query.lower()))
+
+
+class SemanticCacheRetriever(BaseRetriever):
+    """Retriever wrapper that caches results by query embedding.
+
+    Entries are dropped as soon as the patient data checksum changes.
+    """
+
+    retriever: BaseRetriever
+    embeddings: Any
+    checksum_fn: Callable[[], str]
+    similarity_threshold: float = 0.9
+    max_entries: int = 256
+    checksum_check_seconds: float = 5.0
+    verbose: bool = True
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    # Query -> (row in _matrix, exact terms, documents), least recently used first
+    _entries: "OrderedDict[str, tuple]" = PrivateAttr(default_factory=OrderedDict)
+    _matrix: Optional[np.ndarray] = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _checksum: Optional[str] = PrivateAttr(default=None)
+    _checked_at: float = PrivateAttr(default=0.0)
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector = self._normalise(self.embeddings.embed_query(query))
+        docs = self._lookup(query, vector)
+        if docs is not None:
+            return docs
+
+        docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        self._store(query, vector, docs)
+        return docs
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = self._normalise(await self.embeddings.aembed_query(query))
+        docs = self._lookup(query, vector)
+        if docs is not None:
+            return docs
+
+        docs = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        self._store(query, vector, docs)
+        return docs
+
+    @staticmethod
+    def _normalise(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _validate(self):
+        """Drop every entry if the patient data changed since they were stored."""
+        now = time.monotonic()
+        if now - self._checked_at < self.checksum_check_seconds:
+            return
+        checksum = self.checksum_fn()
+        with self._lock:
+            self._checked_at = now
+            if checksum != self._checksum:
+                if self._entries and self.verbose:
+                    print("🔄 Patient data changed - clearing semantic cache")
+                self._entries.clear()
+                self._checksum = checksum
+
+    def _lookup(self, query: str, vector: np.ndarray) -> Optional[List[Document]]:
+        self._validate()
+        terms = exact_terms(query)
+        with self._lock:
+            if self._entries:
+                # Rows 0..n-1 are always occupied: evicted rows are reused, and a clear empties them all
+                similarities = self._matrix[:len(self._entries)] @ vector
+                rows = {row: key for key, (row, _, _) in self._entries.items()}
+                candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+                for row in candidates[np.argsort(-similarities[candidates])]:
+                    key = rows[int(row)]
+                    _, entry_terms, docs = self._entries[key]
+                    if entry_terms != terms:
+                        continue
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    tracing.annotate(semantic_cache_hit=True)
+                    if self.verbose:
+                        print(f"♻️  Semantic cache hit ({similarities[row]:.3f}): '{key}'")
+                    return [doc.model_copy(deep=True) for doc in docs]
+            self._misses += 1
+            tracing.annotate(semantic_cache_hit=False)
+            return None
+
+    def _store(self, query: str, vector: np.ndarray, docs: List[Document]):
+        # A BM25 fallback ranking, made while the reranker was failing, is not worth replaying
+        if any(doc.metadata.get("rerank_method", COHERE_METHOD) != COHERE_METHOD for doc in docs):
+            return
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != len(vector):
+                self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._entries.clear()
+            if query in self._entries:
+                row = self._entries.pop(query)[0]
+            elif len(self._entries) < self.max_entries:
+                row = len(self._entries)
+            else:
+                row = self._entries.popitem(last=False)[1][0]
+            self._matrix[row] = vector
+            self._entries[query] = (row, exact_terms(query), [doc.model_copy(deep=True) for doc in docs])
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of cached queries."""
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "entries": len(self._entries)}
@@ -0,0 +1,34 @@
+"""
+Token counting for the Medical RAG system.
+Uses the same tokenizer as the chat model so counts match what the API bills.
+
+tiktoken downloads the encoding on first use. Without network access or a warm
+tiktoken cache (TIKTOKEN_CACHE_DIR), tokens are estimated from the text length instead,
+so offline runs keep working.
+"""
+
+from functools import lru_cache
+from typing import Optional
+import tiktoken
+
+TOKENIZER_MODEL = "gpt-4o"
+
+# Rough characters per token for English text, used when the encoding is unavailable
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding() -> Optional[tiktoken.Encoding]:
+    try:
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except Exception as e:
+        print(f"⚠️ Could not load the {TOKENIZER_MODEL} tokenizer, estimating tokens from length ({type(e).__name__})")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in a text."""
+    encoding = _encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
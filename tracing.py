@@ -0,0 +1,208 @@
+"""
+Workflow Tracing for Medical RAG System
+Records one span per LangGraph node execution and writes them as JSONL.
+
+Each span holds the node's wall time, prompt and completion tokens reported by the
+chat model, the size of the context the node worked on, and any counters the node
+annotated along the way (retrieved, deduplicated and reranked documents, cache hits).
+
+Summarise a trace file with:
+    python tracing.py summary traces.jsonl
+"""
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import inspect
+import json
+import math
+import threading
+import time
+
+from token_counter import count_tokens
+
+# Nodes that read the retrieved context from the last message
+CONTEXT_NODES = ("grade_documents", "compress_context", "generate_answer")
+
+# Span of the node currently running in this thread or task
+_current_span: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_span", default=None)
+
+
+def annotate(**fields):
+    """Attach counters to the span of the node currently running. No-op outside a traced node."""
+    span = _current_span.get()
+    if span is not None:
+        span.update(fields)
+
+
+def _content_size(message) -> Dict[str, int]:
+    content = getattr(message, "content", "")
+    if not isinstance(content, str):
+        content = str(content)
+    return {"context_chars": len(content), "context_tokens": count_tokens(content)}
+
+
+def _iteration(state) -> int:
+    """Rewrite-loop iteration: every rewrite adds one more human message to the conversation."""
+    return max(sum(isinstance(message, HumanMessage) for message in state.get("messages", [])) - 1, 0)
+
+
+class WorkflowTracer(BaseCallbackHandler):
+    """Collects per-node spans for a workflow.
+
+    Node functions are wrapped with wrap(); the tracer is also registered as a callback
+    so token usage from chat model calls is added to the span of the node that made them.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8") if path else None
+
+    def wrap(self, name: str, fn: Callable) -> Callable:
+        """Wrap a node or routing function so every call records a span."""
+        accepts_config = "config" in inspect.signature(fn).parameters
+
+        def run(state, config):
+            span = {
+                "node": name,
+                "question_id": state.get("question_id"),
+                "iteration": _iteration(state),
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "llm_calls": 0,
+            }
+            if name in CONTEXT_NODES and state.get("messages"):
+                span.update(_content_size(state["messages"][-1]))
+
+            token = _current_span.set(span)
+            start = time.perf_counter()
+            try:
+                result = fn(state, config) if accepts_config else fn(state)
+                if name == "retrieve" and isinstance(result, dict) and result.get("messages"):
+                    span.update(_content_size(result["messages"][-1]))
+                elif not isinstance(result, dict):
+                    span["decision"] = result
+                return result
+            except Exception as e:
+                span["error"] = repr(e)
+                raise
+            finally:
+                span["duration_ms"] = (time.perf_counter() - start) * 1000
+                _current_span.reset(token)
+                self._emit(span)
+
+        # LangGraph only passes the run config to functions that declare it
+        if accepts_config:
+            def traced(state, config: RunnableConfig):
+                return run(state, config)
+        else:
+            def traced(state):
+                return run(state, None)
+
+        traced.__name__ = name
+        traced.__doc__ = fn.__doc__
+        return traced
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        span = _current_span.get()
+        if span is None:
+            return
+
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+
+        # Older integrations only report usage in llm_output
+        if not prompt_tokens and not completion_tokens and response.llm_output:
+            usage = response.llm_output.get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+
+        with self._lock:
+            span["llm_calls"] += 1
+            span["prompt_tokens"] += prompt_tokens
+            span["completion_tokens"] += completion_tokens
+
+    def _emit(self, span: Dict[str, Any]):
+        span["timestamp"] = time.time()
+        with self._lock:
+            self.spans.append(span)
+            if self._file is not None:
+                self._file.write(json.dumps(span, default=str) + "\n")
+                self._file.flush()
+
+    def spans_for(self, question_id: str) -> List[Dict[str, Any]]:
+        """Spans recorded so far for one question."""
+        with self._lock:
+            return [span for span in self.spans if span.get("question_id") == question_id]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Per-node call counts, latency percentiles and average token usage."""
+    by_node: Dict[str, List[Dict[str, Any]]] = {}
+    for span in spans:
+        by_node.setdefault(span["node"], []).append(span)
+
+    rows = []
+    for node, node_spans in by_node.items():
+        durations = [span["duration_ms"] for span in node_spans]
+        rows.append({
+            "node": node,
+            "count": len(node_spans),
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "p99_ms": percentile(durations, 99),
+            "avg_prompt_tokens": sum(span.get("prompt_tokens", 0) for span in node_spans) / len(node_spans),
+            "avg_completion_tokens": sum(span.get("completion_tokens", 0) for span in node_spans) / len(node_spans),
+        })
+    return sorted(rows, key=lambda row: row["p50_ms"] * row["count"], reverse=True)
+
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def print_summary(path: str):
+    spans = load_spans(path)
+    print(f"📈 {len(spans)} spans from {path}")
+    print(f"{'node':<26}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'prompt tok':>12}{'compl tok':>11}")
+    for row in summarize(spans):
+        print(f"{row['node']:<26}{row['count']:>7}{row['p50_ms']:>11.1f}{row['p95_ms']:>11.1f}{row['p99_ms']:>11.1f}"
+              f"{row['avg_prompt_tokens']:>12.0f}{row['avg_completion_tokens']:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Medical RAG workflow traces")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    summary = subcommands.add_parser("summary", help="Print per-node latency percentiles and token usage")
+    summary.add_argument("path", nargs="?", default="traces.jsonl")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        print_summary(args.path)
+
+
+if __name__ == "__main__":
+    main()